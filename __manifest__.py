@@ -18,6 +18,7 @@
         'sale',
         'account',
         'mail',
+        'bus',
     ],
     'installable': True,
     'auto_install': False,
@@ -28,13 +29,19 @@
     'images': ['static/description/icon.png'],
     'data': [
         'security/ir.model.access.csv',
+        'data/orange_money_cron.xml',
         'views/menus.xml',
         'views/orange_money_config_views.xml',
         'views/orange_money_transaction_views.xml',
+        'views/orange_money_settlement_views.xml',
+        'views/orange_money_webhook_event_views.xml',
+        'views/orange_money_status_event_views.xml',
+        'views/orange_money_archive_views.xml',
+        'views/account_move_views.xml',
         
         # 'views/sale_order_views.xml',
         'views/orange_money_menus.xml',
-        # 'views/res_partner_views.xml',
+        'views/res_partner_views.xml',
     ],
     
     'license': 'LGPL-3',
@@ -3,3 +3,4 @@
 from . import orange_money_controller
 
 from . import orange_money_webhook
+from . import orange_money_status_stream
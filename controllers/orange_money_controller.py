@@ -1,5 +1,5 @@
 from odoo import http, fields
-from odoo.http import request, Response
+from odoo.http import request, Response, Stream
 import requests
 import hmac
 import hashlib
@@ -8,6 +8,10 @@ import logging
 import werkzeug
 from datetime import datetime
 import base64
+import psycopg2
+import psycopg2.errorcodes
+
+from ..models.orange_money_transaction import TERMINAL_STATUSES
 
 _logger = logging.getLogger(__name__)
 
@@ -57,113 +61,224 @@ class OrangeMoneyController(http.Controller):
             
             # Vérifier si la transaction Orange Money existe déjà
             existing_tx = request.env['orange.money.transaction'].sudo().search([('transaction_id', '=', transaction_id)], limit=1)
+            if existing_tx and existing_tx._is_stale_reservation():
+                # Réservation orpheline (requête interrompue entre deux phases) : on la reprend
+                _logger.warning("Réservation PRE_INITIATED orpheline pour %s : reprise de l'initiation", transaction_id)
+                self._release_reservation(existing_tx)
+                existing_tx = existing_tx.browse()
             if existing_tx:
-                return self._make_response({
-                    'success': True,
-                    'transaction_id': existing_tx.transaction_id,
-                    'pay_token': existing_tx.pay_token,
-                    'payment_url': existing_tx.payment_url,
-                    'status': existing_tx.status or 'INITIATED',
-                    'account_move_id': existing_tx.account_move_id.id if existing_tx.account_move_id else False,
-                    'partner_id': existing_tx.partner_id.id,
-                    'reference': existing_tx.reference,
-                    'success_url': f"https://portail.toubasandaga.sn/om-paiement?transaction={existing_tx.transaction_id}",
-                    'deep_link': existing_tx.deep_link,
-                    'deep_link_om': existing_tx.deep_link_om,
-                    'deep_link_maxit': existing_tx.deep_link_maxit,
-                    'short_link': existing_tx.short_link,
-                    'qr_code_base64': existing_tx.qr_code_base64,
-                    'qr_id': existing_tx.qr_id,
-                    'validity_seconds': existing_tx.validity_seconds,
-                    'valid_from': existing_tx.valid_from.isoformat() if existing_tx.valid_from else None,
-                    'valid_until': existing_tx.valid_until.isoformat() if existing_tx.valid_until else None,
-                    'existe': True
-                }, 200)
+                if existing_tx.status == 'PRE_INITIATED':
+                    # Doublon d'une initiation encore en cours : le client réessaiera
+                    return self._initiation_in_progress_response(transaction_id)
+                return self._existing_initiation_response(existing_tx)
             
-            # Créer l'ordre de paiement Orange Money via la méthode du modèle de configuration
+            # Initiation en trois phases : aucune transaction SQL ouverte pendant l'appel à Orange
+            orange_transaction = None
+            reserved = False
             try:
                 success_url_new =  f"https://portail.toubasandaga.sn/om-paiement?transaction={transaction_id}"
                 cancel_url = None
                 cancel_url = f"https://portail.toubasandaga.sn/facture-magasin?transaction={account_move.transaction_id}"
 
-                payment_data_from_config = config.create_payment_invoice(
-                    amount=amount,
-                    currency=currency,
-                    account_move_id = account_move.id,
-                    transaction_id=transaction_id,
-                    customer_msisdn=customer_msisdn,
-                    description=description,
-                    reference=reference,
-                    success_url=success_url_new ,
-                    cancel_url=cancel_url
+                # Phase 1 : préparer l'appel (token, clé publique), réserver la ligne, valider
+                metadata = config._prepare_invoice_qr_metadata(
+                    account_move.id, transaction_id, customer_msisdn, description, reference, success_url_new
                 )
-                
-            
-                if payment_data_from_config and payment_data_from_config.get('success'):
-                    # Créer la transaction dans Odoo
-                    orange_transaction = request.env['orange.money.transaction'].sudo().create({
-                        'success_url': success_url_new,
-                        'cancel_url': cancel_url,
-                        'pay_token': payment_data_from_config.get('pay_token'),
-                        'transaction_id': transaction_id,
-                        'amount': amount,
-                        'currency': currency,
-                        'status': 'INITIATED',
-                        'customer_msisdn': customer_msisdn,
-                        'merchant_code': config.merchant_code,
-                        'reference': reference,
-                        'description': description,
-                        'payment_url': payment_data_from_config.get('payment_url'),
-                        'qr_code_url': payment_data_from_config.get('deep_link'), # Utiliser deep_link pour qr_code_url
-                        'qr_code_base64': payment_data_from_config.get('qr_code_base64'),
-                        'qr_id': payment_data_from_config.get('qr_id'),
-                        'deep_link': payment_data_from_config.get('deep_link'),
-                        'deep_link_om': payment_data_from_config.get('deep_link_om'),
-                        'deep_link_maxit': payment_data_from_config.get('deep_link_maxit'),
-                        'short_link': payment_data_from_config.get('short_link'),
-                        'validity_seconds': payment_data_from_config.get('validity_seconds'),
-                        'valid_from': payment_data_from_config.get('valid_from'),
-                        'valid_until': payment_data_from_config.get('valid_until'),
-                        'orange_response': payment_data_from_config.get('orange_response'),
-                        'metadata': payment_data_from_config.get('metadata'),
-                        'account_move_id': account_move.id, # Correction: doit être l'ID de la commande Odoo
-                        'partner_id': partner.id,
-                        'orange_id': payment_data_from_config.get('qr_id'),
-                        'qr_code_url': payment_data_from_config.get('deep_link'),
-                        'callback_url': payment_data_from_config.get('callback_url'),
-                    })
-                    
-                    return self._make_response({
-                        'success': True,
-                        'success_url': orange_transaction.success_url,
-                        'cancel_url': orange_transaction.cancel_url,
-                        'transaction_id': orange_transaction.transaction_id,
-                        'pay_token': orange_transaction.pay_token,
-                        'payment_url': orange_transaction.payment_url,
-                        'status': 'INITIATED',
-                        'account_move_id': orange_transaction.account_move_id.id if orange_transaction.account_move_id else False,
-                        'partner_id': orange_transaction.partner_id.id,
-                        'reference': reference,
-                        'deep_link': orange_transaction.deep_link,
-                        'deep_link_om': orange_transaction.deep_link_om,
-                        'deep_link_maxit': orange_transaction.deep_link_maxit,
-                        'short_link': orange_transaction.short_link,
-                        'qr_code_base64': orange_transaction.qr_code_base64,
-                        'qr_id': orange_transaction.qr_id,
-                        'validity_seconds': orange_transaction.validity_seconds,
-                        'valid_from': orange_transaction.valid_from.isoformat() if orange_transaction.valid_from else None,
-                        'valid_until': orange_transaction.valid_until.isoformat() if orange_transaction.valid_until else None,
-                    }, 200)
-                else:
-                    return self._make_response({'error': payment_data_from_config.get('message', 'Failed to create Orange Money payment order')}, 400)
+                payload = config._prepare_qr_payload(
+                    amount, metadata=metadata, success_url=success_url_new, cancel_url=cancel_url
+                )
+                base_url, headers = config.base_url, config._prepare_qr_headers()
+                # Réservation atomique : l'index unique sur transaction_id départage les doublons
+                # concurrents, un seul appel Orange par paiement logique
+                try:
+                    with request.env.cr.savepoint():
+                        orange_transaction = request.env['orange.money.transaction'].sudo().create({
+                            'success_url': success_url_new,
+                            'cancel_url': cancel_url,
+                            'transaction_id': transaction_id,
+                            'amount': amount,
+                            'currency': currency,
+                            'status': 'PRE_INITIATED',
+                            'customer_msisdn': customer_msisdn,
+                            'merchant_code': config.merchant_code,
+                            'reference': reference,
+                            'description': description,
+                            'account_move_id': account_move.id,
+                            'partner_id': partner.id,
+                        })
+                except psycopg2.IntegrityError as e:
+                    if e.pgcode != psycopg2.errorcodes.UNIQUE_VIOLATION:
+                        raise
+                    _logger.info("Initiation concurrente du même transaction_id %s : le client réessaiera", transaction_id)
+                    return self._initiation_in_progress_response(transaction_id)
+                request.env.cr.commit()
+                reserved = True
+
+                # Phase 2 : appel HTTP seul, sans aucune requête SQL
+                try:
+                    qr_data = config._request_qr_code(base_url, headers, payload)
+                except Exception as e:
+                    # Libérer la réservation : le client pourra réessayer avec le même transaction_id
+                    _logger.error(f"Error creating Orange Money payment order: {str(e)}")
+                    self._release_reservation(orange_transaction)
+                    return self._make_response({'error': f"Erreur lors de la génération du QR code: {str(e)}"}, 400)
+
+                # Phase 3 : courte transaction qui enregistre le QR sur la ligne réservée
+                payment_data_from_config = config._parse_qr_data(qr_data)
+                orange_transaction.write({
+                    'status': 'INITIATED',
+                    'pay_token': payment_data_from_config.get('pay_token'),
+                    'payment_url': payment_data_from_config.get('payment_url'),
+                    'qr_code_url': payment_data_from_config.get('deep_link'), # Utiliser deep_link pour qr_code_url
+                    'qr_code_base64': payment_data_from_config.get('qr_code_base64'),
+                    'qr_id': payment_data_from_config.get('qr_id'),
+                    'deep_link': payment_data_from_config.get('deep_link'),
+                    'deep_link_om': payment_data_from_config.get('deep_link_om'),
+                    'deep_link_maxit': payment_data_from_config.get('deep_link_maxit'),
+                    'short_link': payment_data_from_config.get('short_link'),
+                    'validity_seconds': payment_data_from_config.get('validity_seconds'),
+                    'valid_from': payment_data_from_config.get('valid_from'),
+                    'valid_until': payment_data_from_config.get('valid_until'),
+                    'orange_response': payment_data_from_config.get('orange_response'),
+                    'metadata': metadata,
+                    'orange_id': payment_data_from_config.get('qr_id'),
+                    'callback_url': payment_data_from_config.get('callback_url'),
+                })
+                request.env.cr.commit()
+
+                return self._make_response({
+                    'success': True,
+                    'success_url': orange_transaction.success_url,
+                    'cancel_url': orange_transaction.cancel_url,
+                    'transaction_id': orange_transaction.transaction_id,
+                    'pay_token': orange_transaction.pay_token,
+                    'payment_url': orange_transaction.payment_url,
+                    'status': 'INITIATED',
+                    'account_move_id': orange_transaction.account_move_id.id if orange_transaction.account_move_id else False,
+                    'partner_id': orange_transaction.partner_id.id,
+                    'reference': reference,
+                    'deep_link': orange_transaction.deep_link,
+                    'deep_link_om': orange_transaction.deep_link_om,
+                    'deep_link_maxit': orange_transaction.deep_link_maxit,
+                    'short_link': orange_transaction.short_link,
+                    'qr_image_url': orange_transaction._get_qr_image_url(),
+                    'qr_id': orange_transaction.qr_id,
+                    'validity_seconds': orange_transaction.validity_seconds,
+                    'valid_from': orange_transaction.valid_from.isoformat() if orange_transaction.valid_from else None,
+                    'valid_until': orange_transaction.valid_until.isoformat() if orange_transaction.valid_until else None,
+                }, 200)
             except Exception as e:
                 _logger.error(f"Error creating Orange Money payment order: {str(e)}")
+                if orange_transaction is not None and reserved:
+                    # Échec après la réservation (phase 3) : la libérer, sinon chaque nouvel essai
+                    # attendrait une initiation qui n'aboutira jamais
+                    request.env.cr.rollback()
+                    self._release_reservation(orange_transaction)
                 return self._make_response({'error': str(e)}, 400)
         except Exception as e:
             _logger.error(f"Error initiating Orange Money payment: {str(e)}")
             return self._make_response({'error': str(e)}, 400)
 
+    def _release_reservation(self, transaction):
+        """Supprimer une réservation restée PRE_INITIATED (jamais une transaction initiée), puis valider."""
+        reservation = transaction.exists().filtered(lambda t: t.status == 'PRE_INITIATED')
+        if reservation:
+            reservation.unlink()
+        request.env.cr.commit()
+
+
+
+    # Délai suggéré au client avant de renvoyer /initiate pendant une initiation concurrente
+    _INITIATE_RETRY_AFTER = 2
+
+    def _initiation_in_progress_response(self, transaction_id):
+        """
+        Une autre requête initie ce transaction_id (ligne PRE_INITIATED) : réponse 202 immédiate
+        plutôt que d'immobiliser un worker HTTP pendant l'appel à Orange. Le client renvoie
+        /initiate après Retry-After, ou suit le statut via /status/<id>/wait.
+        """
+        return request.make_response(
+            json.dumps({
+                'success': False,
+                'in_progress': True,
+                'transaction_id': transaction_id,
+                'status': 'PRE_INITIATED',
+                'retry_after': self._INITIATE_RETRY_AFTER,
+                'message': "Initiation de ce paiement en cours, veuillez réessayer dans un instant",
+            }),
+            status=202,
+            headers={
+                'Content-Type': 'application/json',
+                'Retry-After': str(self._INITIATE_RETRY_AFTER),
+            }
+        )
+
+    def _existing_initiation_response(self, existing_tx):
+        return self._make_response({
+            'success': True,
+            'transaction_id': existing_tx.transaction_id,
+            'pay_token': existing_tx.pay_token,
+            'payment_url': existing_tx.payment_url,
+            'status': existing_tx.status or 'INITIATED',
+            'account_move_id': existing_tx.account_move_id.id if existing_tx.account_move_id else False,
+            'partner_id': existing_tx.partner_id.id,
+            'reference': existing_tx.reference,
+            'success_url': f"https://portail.toubasandaga.sn/om-paiement?transaction={existing_tx.transaction_id}",
+            'deep_link': existing_tx.deep_link,
+            'deep_link_om': existing_tx.deep_link_om,
+            'deep_link_maxit': existing_tx.deep_link_maxit,
+            'short_link': existing_tx.short_link,
+            'qr_image_url': existing_tx._get_qr_image_url(),
+            'qr_id': existing_tx.qr_id,
+            'validity_seconds': existing_tx.validity_seconds,
+            'valid_from': existing_tx.valid_from.isoformat() if existing_tx.valid_from else None,
+            'valid_until': existing_tx.valid_until.isoformat() if existing_tx.valid_until else None,
+            'existe': True
+        }, 200)
+
+    _INITIATE_BATCH_MAX = 500
+    # Groupe requis pour initier des paiements en lot (droit de création sur les transactions)
+    _INITIATE_BATCH_GROUP = 'sales_team.group_sale_salesman'
+
+    @http.route('/api/payment/orange/initiate/batch', type='http', auth='user', methods=['POST'], csrf=False)
+    def initiate_orange_payment_batch(self, **kwargs):
+        """
+        Initier en une fois les paiements de plusieurs factures : {"invoice_ids": [...]}.
+        Réponse : un résultat par facture. Rejouer le même appel après une interruption
+        ne régénère pas les QR déjà créés (ils sont renvoyés avec existing=true).
 
+        Réservé aux utilisateurs connectés du groupe commercial. Le corps doit être envoyé en
+        application/json : un formulaire d'un autre site ne peut pas produire cette requête
+        (pré-vol CORS refusé), ce qui tient lieu de protection CSRF.
+        """
+        if not request.env.user.has_group(self._INITIATE_BATCH_GROUP):
+            return self._make_response({'success': False, 'error': 'Accès refusé'}, 403)
+        if request.httprequest.mimetype != 'application/json':
+            return self._make_response({'success': False, 'error': 'Content-Type application/json requis'}, 415)
+        try:
+            try:
+                data = json.loads(request.httprequest.data or b'{}')
+                invoice_ids = [int(invoice_id) for invoice_id in data.get('invoice_ids') or []]
+            except (ValueError, TypeError, AttributeError):
+                return self._make_response({'success': False, 'error': 'JSON invalide'}, 400)
+            if not invoice_ids:
+                return self._make_response({'success': False, 'error': 'invoice_ids est requis'}, 400)
+            if len(invoice_ids) > self._INITIATE_BATCH_MAX:
+                return self._make_response({
+                    'success': False,
+                    'error': f'{self._INITIATE_BATCH_MAX} factures au plus par appel',
+                }, 400)
+
+            moves = request.env['account.move'].sudo().browse(invoice_ids).exists()
+            results = moves._orange_money_bulk_initiate()
+            items = []
+            for invoice_id in dict.fromkeys(invoice_ids):
+                result = results.get(invoice_id, {'success': False, 'message': "La facture n'existe pas"})
+                items.append({'invoice_id': invoice_id, **result})
+            return self._make_response({'success': True, 'items': items}, 200)
+        except Exception as e:
+            _logger.error(f"Error initiating Orange Money payments in batch: {str(e)}")
+            return self._make_response({'success': False, 'error': str(e)}, 400)
 
     @http.route('/api/payment/orange/token/<string:pay_token>', type='http', auth='public', cors='*', methods=['GET'])
     def get_orange_payment_by_token(self, pay_token, **kwargs):
@@ -175,7 +290,7 @@ class OrangeMoneyController(http.Controller):
                 return self._make_response({'error': 'Configuration not found'}, 400)
             
             # Utiliser la nouvelle méthode du modèle pour récupérer le statut par pay_token
-            payment_data = config.get_payment_status_by_token(pay_token)
+            payment_data = config.with_context(om_status_source='poll').get_payment_status_by_token(pay_token)
             
             if payment_data:
                 # Rechercher la transaction correspondante dans Odoo
@@ -189,10 +304,9 @@ class OrangeMoneyController(http.Controller):
                     status = payment_data.get('status', '').upper()
                     odoo_status = self._map_orange_status_to_odoo(status)
                     if odoo_status and odoo_status != transaction.status:
-                        transaction.write({
-                            'status': odoo_status,
-                            'orange_response': json.dumps(payment_data),
-                            'webhook_data': json.dumps(payment_data),
+                        transaction.with_context(om_status_source='poll')._set_status(odoo_status, {
+                            'orange_response': payment_data,
+                            'webhook_data': payment_data,
                         })
                     result['transaction'] = {
                         'id': transaction.id,
@@ -205,7 +319,8 @@ class OrangeMoneyController(http.Controller):
                         'deep_link_om': transaction.deep_link_om,
                         'deep_link_maxit': transaction.deep_link_maxit,
                         'short_link': transaction.short_link,
-                        'qr_code_base64': transaction.qr_code_base64,
+                        'qr_image_url': transaction._get_qr_image_url(),
+                        'receipt_url': transaction._get_receipt_url(),
                         'qr_id': transaction.qr_id,
                         'validity_seconds': transaction.validity_seconds,
                         'valid_from': transaction.valid_from.isoformat() if transaction.valid_from else None,
@@ -242,80 +357,215 @@ class OrangeMoneyController(http.Controller):
             headers={'Content-Type': 'application/json'}
         )
 
-    def _order_to_dict(self, order):
-        if not order:
-            return None
-        return {
-            'id': order.id,
-            'type_sale': order.type_sale,
-            'name': order.name,
-            'partner_id': order.partner_id.id,
-            'type_sale': order.type_sale,
-            'currency_id': order.currency_id.id,
-            'company_id': order.company_id.id,
-            'state': order.state,
-            'amount_total': order.amount_total,
-            'invoice_status': order.invoice_status,
-            'amount_total': order.amount_total,
-            'advance_payment_status': order.advance_payment_status
-        }
-
-
-
+    # Champs du modèle exposés tels quels par l'API partenaire
+    _PARTNER_TX_FIELDS = (
+        'transaction_id', 'pay_token', 'reference', 'status', 'amount', 'currency',
+        'customer_msisdn', 'description', 'payment_url', 'account_move_id', 'partner_id',
+        'created_at', 'updated_at', 'completed_at', 'url_facture', 'facture_filename', 'deep_link',
+        'deep_link_om', 'deep_link_maxit', 'short_link', 'qr_id', 'validity_seconds', 'valid_from',
+        'valid_until',
+    )
+    # QR et reçu : jamais de contenu inline, seulement l'URL de l'endpoint binaire
+    _PARTNER_TX_URL_FIELDS = {
+        'qr_image_url': ('transaction_id', 'qr_id'),
+        'receipt_url': ('transaction_id', 'facture_generated_at'),
+    }
+    _PARTNER_TX_DEFAULT_LIMIT = 50
+    _PARTNER_TX_MAX_LIMIT = 200
+
+    def _parse_partner_tx_fields(self, fields_param):
+        """Projection demandée (?fields=a,b,c), tous les champs par défaut."""
+        if not fields_param:
+            return list(self._PARTNER_TX_FIELDS) + list(self._PARTNER_TX_URL_FIELDS)
+        requested = [name.strip() for name in fields_param.split(',') if name.strip()]
+        unknown = [
+            name for name in requested
+            if name not in self._PARTNER_TX_FIELDS and name not in self._PARTNER_TX_URL_FIELDS
+        ]
+        if unknown:
+            raise ValueError(f"Champs inconnus: {', '.join(unknown)}")
+        return requested
+
+    def _get_partner_tx_model_fields(self, public_fields):
+        model_fields = set()
+        for name in public_fields:
+            if name in self._PARTNER_TX_URL_FIELDS:
+                model_fields.update(self._PARTNER_TX_URL_FIELDS[name])
+            else:
+                model_fields.add(name)
+        return list(model_fields)
+
+    def _serialize_partner_tx(self, row, public_fields, transactions, base_url):
+        item = {}
+        for name in public_fields:
+            if name == 'qr_image_url':
+                item[name] = transactions._build_qr_image_url(row['transaction_id'], row['qr_id'], base_url)
+                continue
+            if name == 'receipt_url':
+                item[name] = transactions._build_receipt_url(
+                    row['transaction_id'], row['facture_generated_at'], base_url
+                )
+                continue
+            value = row[name]
+            if isinstance(value, tuple):
+                value = value[0]
+            elif isinstance(value, datetime):
+                value = value.isoformat()
+            elif value is False:
+                value = None
+            item[name] = value
+        return item
+
+    def _stream_partner_tx(self, rows, public_fields, next_cursor, transactions, base_url):
+        """Générateur JSON : les lignes sont sérialisées une à une, jamais concaténées en mémoire."""
+        yield '{"success": true, "next_cursor": %s, "items": [' % json.dumps(next_cursor)
+        for index, row in enumerate(rows):
+            if index:
+                yield ','
+            yield json.dumps(self._serialize_partner_tx(row, public_fields, transactions, base_url))
+        yield ']}'
 
     # Route pour récupérer les transactions d'un partenaire
     @http.route('/api/payment/orange/partner/<int:partner_id>/transactions', type='http', auth='public', cors='*', methods=['GET'])
-    def get_partner_orange_transactions(self, partner_id):
+    def get_partner_orange_transactions(self, partner_id, limit=None, cursor=None, fields=None, **kwargs):
+        """
+        Transactions d'un partenaire, de la plus récente à la plus ancienne.
+
+        - limit : taille de page (50 par défaut, 200 au plus)
+        - cursor : valeur next_cursor de la page précédente
+        - fields : projection (ex. fields=transaction_id,status,amount) ;
+          le QR et le reçu sont exposés par URL (qr_image_url, receipt_url)
+        """
         try:
-            partner = request.env['res.partner'].sudo().search([('id', '=', partner_id)])
-            if not partner:
+            if not request.env['res.partner'].sudo().search_count([('id', '=', partner_id)]):
                 return self._make_response({'success': False, 'error': 'Partner not found'}, 404)
-            
-            resultats = []
-            transactions = request.env['orange.money.transaction'].sudo().search([('partner_id', '=', partner_id)])
-            
-            for transaction in transactions:
-                # Convertir les données binaires en base64
-                facture_pdf_base64 = None
-                if transaction.facture_pdf:
-                    facture_pdf_base64 = base64.b64encode(transaction.facture_pdf).decode('utf-8')
-                
-                resultats.append({
-                    'transaction_id': transaction.transaction_id,
-                    'pay_token': transaction.pay_token,
-                    'reference': transaction.reference,
-                    'status': transaction.status,
-                    'amount': transaction.amount,
-                    'currency': transaction.currency,
-                    'customer_msisdn': transaction.customer_msisdn,
-                    'description': transaction.description,
-                    'payment_url': transaction.payment_url,
-                    'order_id': transaction.order_id.id if transaction.order_id else None,
-                    'order': self._order_to_dict(transaction.order_id),
-                    'partner_id': transaction.partner_id.id,
-                    'created_at': transaction.created_at.isoformat() if transaction.created_at else None,
-                    'updated_at': transaction.updated_at.isoformat() if transaction.updated_at else None,
-                    'completed_at': transaction.completed_at.isoformat() if transaction.completed_at else None,
-                    'url_facture': transaction.url_facture,
-                    'facture_pdf_base64': facture_pdf_base64,
-                    'facture_filename': transaction.facture_filename,
-                    'deep_link': transaction.deep_link,
-                    'deep_link_om': transaction.deep_link_om,
-                    'deep_link_maxit': transaction.deep_link_maxit,
-                    'short_link': transaction.short_link,
-                    'qr_code_base64': transaction.qr_code_base64,
-                    'qr_id': transaction.qr_id,
-                    'validity_seconds': transaction.validity_seconds,
-                    'valid_from': transaction.valid_from.isoformat() if transaction.valid_from else None,
-                    'valid_until': transaction.valid_until.isoformat() if transaction.valid_until else None,
-                })
-            return self._make_response(resultats, 200)
+
+            try:
+                public_fields = self._parse_partner_tx_fields(fields)
+                limit = min(int(limit or self._PARTNER_TX_DEFAULT_LIMIT), self._PARTNER_TX_MAX_LIMIT)
+                cursor = int(cursor) if cursor else None
+            except ValueError as e:
+                return self._make_response({'success': False, 'error': str(e)}, 400)
+            if limit <= 0:
+                return self._make_response({'success': False, 'error': 'limit doit être positif'}, 400)
+
+            domain = [('partner_id', '=', partner_id)]
+            if cursor:
+                domain.append(('id', '<', cursor))
+            model_fields = self._get_partner_tx_model_fields(public_fields)
+            transactions = request.env['orange.money.transaction'].sudo()
+            base_url = transactions._get_public_base_url()
+
+            # Une seule requête ; une ligne de plus pour savoir s'il existe une page suivante
+            rows = transactions.search_read(
+                domain, model_fields, order='id desc', limit=limit + 1
+            )
+            next_cursor = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = str(rows[-1]['id'])
+
+            return Response(
+                self._stream_partner_tx(rows, public_fields, next_cursor, transactions, base_url),
+                status=200,
+                headers={'Content-Type': 'application/json'},
+            )
         except Exception as e:
             _logger.error(f"Error getting partner Orange Money transactions: {str(e)}")
             return self._make_response({'success': False, 'error': str(e)}, 400)
+
+    _CHANGES_DEFAULT_LIMIT = 200
+    _CHANGES_MAX_LIMIT = 1000
+    # Le flux expose montants, clients, factures et paiements de toutes les transactions
+    _CHANGES_GROUP = 'sales_team.group_sale_salesman'
+
+    @http.route('/api/payment/orange/changes', type='http', auth='user', methods=['GET'])
+    def get_orange_transaction_changes(self, since=None, limit=None, **kwargs):
+        """
+        Flux incrémental des transactions modifiées depuis `since` (curseur opaque renvoyé
+        par l'appel précédent ; absent = depuis le début). Les valeurs vides sont omises.
+        Réappeler avec next_cursor tant que has_more est vrai.
+
+        Réservé aux utilisateurs connectés du groupe commercial.
+        """
+        if not request.env.user.has_group(self._CHANGES_GROUP):
+            return self._make_response({'success': False, 'error': 'Accès refusé'}, 403)
+        try:
+            try:
+                limit = min(int(limit or self._CHANGES_DEFAULT_LIMIT), self._CHANGES_MAX_LIMIT)
+                transactions = request.env['orange.money.transaction'].sudo()
+                rows, next_cursor, has_more = transactions._read_changes(since=since, limit=max(limit, 1))
+            except ValueError:
+                return self._make_response({'success': False, 'error': 'Paramètre since ou limit invalide'}, 400)
+
+            items = []
+            for row in rows:
+                item = {}
+                for key, value in row.items():
+                    if value is None:
+                        continue
+                    item[key] = value.isoformat() if isinstance(value, datetime) else value
+                items.append(item)
+
+            return self._make_response({
+                'success': True,
+                'next_cursor': next_cursor,
+                'has_more': has_more,
+                'items': items,
+            }, 200)
+        except Exception as e:
+            _logger.error(f"Error reading Orange Money change feed: {str(e)}")
+            return self._make_response({'success': False, 'error': str(e)}, 400)
         
 
 
+    @http.route('/api/payment/orange/qr/<string:transaction_id>', type='http', auth='public', cors='*', methods=['GET'])
+    def get_orange_qr_image(self, transaction_id, v=None, **kwargs):
+        """
+        Image PNG du QR code. ETag = empreinte du contenu ; avec ?v=<qrId> (URL fournie
+        par les réponses JSON) la réponse est immuable et reste en cache navigateur.
+        """
+        transaction = request.env['orange.money.transaction'].sudo().search(
+            [('transaction_id', '=', transaction_id)], limit=1
+        )
+        png = transaction._get_qr_png() if transaction else None
+        if not png:
+            return self._make_response({'success': False, 'error': 'QR code not found'}, 404)
+
+        stream = Stream(
+            type='data',
+            data=png,
+            mimetype='image/png',
+            size=len(png),
+            download_name=f"qr_{transaction.transaction_id}.png",
+            etag=hashlib.sha256(png).hexdigest(),
+            last_modified=transaction.valid_from or transaction.created_at,
+        )
+        return stream.get_response(immutable=bool(v) and v == transaction.qr_id)
+
+    @http.route('/api/payment/orange/receipt/<string:transaction_id>', type='http', auth='public', cors='*', methods=['GET'])
+    def get_orange_receipt(self, transaction_id, v=None, download=None, **kwargs):
+        """
+        Reçu PDF servi depuis le filestore via ir.binary : ETag (checksum de la pièce jointe),
+        X-Sendfile / X-Accel-Redirect si le serveur est configuré, cache immuable avec ?v=.
+        """
+        Transaction = request.env['orange.money.transaction'].sudo()
+        transaction = Transaction.search([('transaction_id', '=', transaction_id)], limit=1)
+        # bin_size : on vérifie la présence du PDF sans charger son contenu
+        if not transaction or not transaction.with_context(bin_size=True).facture_pdf:
+            return self._make_response({'success': False, 'error': 'Receipt not found'}, 404)
+
+        stream = request.env['ir.binary']._get_stream_from(
+            transaction, 'facture_pdf',
+            filename=transaction.facture_filename or f"facture_orange_{transaction.transaction_id}.pdf",
+            mimetype='application/pdf',
+        )
+        version = Transaction._receipt_version(transaction.facture_generated_at) if transaction.facture_generated_at else None
+        return stream.get_response(
+            as_attachment=bool(download),
+            immutable=bool(v) and v == version,
+        )
+
     def _build_transaction_response(self, transaction):
         """Construit la réponse JSON complète pour une transaction"""
         return self._make_response({
@@ -335,12 +585,80 @@ class OrangeMoneyController(http.Controller):
             'updated_at': transaction.updated_at.isoformat() if transaction.updated_at else None,
             'channel': transaction.channel,
             'type': transaction.transaction_type,
-            'metadata': json.loads(transaction.metadata) if transaction.metadata else None,
+            'metadata': transaction.metadata or None,
             'success_url': transaction.success_url,
         
         }, 200)
     
     
+    _STATUS_BATCH_MAX = 100
+
+    @http.route('/api/payment/orange/status/batch', type='http', auth='public', cors='*', methods=['POST'], csrf=False)
+    def get_orange_payment_status_batch(self, **kwargs):
+        """
+        Statut de plusieurs transactions : {"transaction_ids": [...]} (100 au plus).
+        Une seule lecture en base ; seules les transactions non finales sont revérifiées
+        chez Orange, en parallèle et en nombre limité.
+        """
+        try:
+            try:
+                data = json.loads(request.httprequest.data or b'{}')
+                transaction_ids = [str(tx_id) for tx_id in data.get('transaction_ids') or []]
+            except (ValueError, TypeError, AttributeError):
+                return self._make_response({'success': False, 'error': 'JSON invalide'}, 400)
+            if not transaction_ids:
+                return self._make_response({'success': False, 'error': 'transaction_ids est requis'}, 400)
+            if len(transaction_ids) > self._STATUS_BATCH_MAX:
+                return self._make_response({
+                    'success': False,
+                    'error': f'{self._STATUS_BATCH_MAX} transactions au plus par appel',
+                }, 400)
+
+            Transaction = request.env['orange.money.transaction'].sudo()
+            rows = Transaction.search_read(
+                [('transaction_id', 'in', transaction_ids)],
+                ['transaction_id', 'transactionId', 'status', 'amount', 'currency', 'completed_at'],
+            )
+            by_transaction_id = {row['transaction_id']: row for row in rows}
+
+            to_refresh = {
+                row['transactionId']: row for row in rows
+                if row['status'] not in TERMINAL_STATUSES and row['transactionId']
+            }
+            config = request.env['orange.money.config'].sudo().search([('is_active', '=', True)], limit=1)
+            if to_refresh and config:
+                results = config._fetch_transaction_statuses(list(to_refresh))
+                for transactionId, result in results.items():
+                    if not result.get('success'):
+                        continue
+                    row = to_refresh[transactionId]
+                    orange_data = result['data']
+                    new_status = Transaction._map_orange_status((orange_data.get('status') or '').upper())
+                    if new_status != row['status']:
+                        transaction = Transaction.browse(row['id']).with_context(om_status_source='poll')
+                        transaction._set_status(new_status, {'orange_response': orange_data})
+                        row['status'] = transaction.status
+                        row['completed_at'] = transaction.completed_at
+
+            items = []
+            for tx_id in dict.fromkeys(transaction_ids):
+                row = by_transaction_id.get(tx_id)
+                if not row:
+                    items.append({'transaction_id': tx_id, 'found': False})
+                    continue
+                items.append({
+                    'transaction_id': tx_id,
+                    'found': True,
+                    'status': row['status'],
+                    'amount': row['amount'],
+                    'currency': row['currency'],
+                    'completed_at': row['completed_at'].isoformat() if row['completed_at'] else None,
+                })
+            return self._make_response({'success': True, 'items': items}, 200)
+        except Exception as e:
+            _logger.exception(f"[Orange Money] Erreur dans get_orange_payment_status_batch : {str(e)}")
+            return self._make_response({'success': False, 'error': str(e)}, 400)
+
     @http.route('/api/payment/orange/status/<string:transaction_id>', type='http', auth='public', cors='*', methods=['GET'])
     def get_orange_payment_status(self, transaction_id, **kwargs):
         """
@@ -356,6 +674,10 @@ class OrangeMoneyController(http.Controller):
             if not transaction:
                 return self._make_response({'success': False, 'error': 'Transaction not found'}, 404)
 
+            # Statut final : plus rien ne peut changer, inutile d'interroger Orange
+            if transaction.status in TERMINAL_STATUSES:
+                return self._build_transaction_response(transaction)
+
             config = request.env['orange.money.config'].sudo().search([('is_active', '=', True)], limit=1)
             if not config:
                 return self._make_response({'success': False, 'error': 'Orange Money configuration not found'}, 400)
@@ -365,7 +687,9 @@ class OrangeMoneyController(http.Controller):
                 return self._build_transaction_response(transaction)
 
             # Appel API Orange Money pour obtenir le statut
-            api_response = config.get_transaction_status(transaction.transactionId)
+            api_response = config.with_context(om_status_source='poll').get_transaction_status(
+                transaction.transactionId, use_cache=True
+            )
             if not api_response or not api_response.get('success'):
                 _logger.warning(f"[Orange Money] Impossible de récupérer le statut réel pour {transaction.transactionId}")
                 return self._build_transaction_response(transaction)
@@ -376,10 +700,9 @@ class OrangeMoneyController(http.Controller):
             # Mise à jour du statut si différent
             new_status = api_response.get('transaction_status')
             if new_status and new_status != transaction.status:
-                transaction.write({
-                    'status': new_status,
+                transaction.with_context(om_status_source='poll')._set_status(new_status, {
                     'updated_at': fields.Datetime.now(),
-                    'orange_response': json.dumps(api_response.get('orange_response', {})),
+                    'orange_response': api_response.get('orange_response', {}),
                 })
 
             # Créer paiement/facture uniquement si la transaction est réussie
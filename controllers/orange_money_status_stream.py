@@ -0,0 +1,217 @@
+import odoo
+from odoo import http, sql_db
+from odoo.http import request, Response
+import contextlib
+import json
+import logging
+import selectors
+import threading
+import time
+
+from ..models.orange_money_transaction import TERMINAL_STATUSES
+
+_logger = logging.getLogger(__name__)
+
+# Attente maximale d'un long-poll, et durée de vie d'un flux SSE avant reconnexion du client
+LONGPOLL_TIMEOUT = 50
+SSE_MAX_DURATION = 600
+SSE_HEARTBEAT = 25
+# Processus sans thread d'écoute (workers HTTP prefork) : relecture périodique du statut
+FALLBACK_POLL_INTERVAL = 2
+
+
+class _StatusDispatch(threading.Thread):
+    """
+    Écoute le canal PostgreSQL « imbus » (alimenté par bus.bus au commit) et réveille
+    les clients qui attendent une transaction. Un seul thread par processus ; sous le
+    worker gevent, chaque client en attente ne coûte qu'une greenlet, sans curseur ouvert.
+
+    Comme le dispatch de bus.bus, l'écoute n'est démarrée qu'en mode threadé ou dans le
+    processus gevent : un worker HTTP prefork n'ouvre pas de connexion LISTEN permanente,
+    ses waiters relisent le statut toutes les FALLBACK_POLL_INTERVAL secondes.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True, name=f'{__name__}.StatusDispatch')
+        self._waiters = {}
+        self._lock = threading.Lock()
+
+    @property
+    def listening(self):
+        return not odoo.multi_process or odoo.evented
+
+    def wait_step(self, timeout):
+        """Durée d'une attente avant relecture : sans écoute, aucune notification ne réveille le waiter."""
+        return timeout if self.listening else min(timeout, FALLBACK_POLL_INTERVAL)
+
+    @contextlib.contextmanager
+    def subscribe(self, db, channel):
+        """
+        Inscrire un waiter sur (db, channel) pour la durée du bloc. À ouvrir AVANT de lire
+        l'état : une notification arrivée entre la lecture et l'attente reste alors visible
+        (l'événement est déjà positionné). Après chaque réveil : clear(), puis relecture.
+        """
+        key = (db, channel)
+        event = threading.Event()
+        with self._lock:
+            self._waiters.setdefault(key, set()).add(event)
+        if self.listening:
+            with contextlib.suppress(RuntimeError):
+                if not self.is_alive():
+                    self.start()
+        try:
+            yield event
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(key)
+                if waiters is not None:
+                    waiters.discard(event)
+                    if not waiters:
+                        del self._waiters[key]
+
+    def wait(self, db, channel, timeout):
+        """Bloquer jusqu'à une notification sur (db, channel) ou l'expiration du délai."""
+        with self.subscribe(db, channel) as event:
+            return event.wait(self.wait_step(timeout))
+
+    def _wake(self, channels):
+        with self._lock:
+            for channel in channels:
+                # Canaux texte de bus.bus : [db, nom]
+                if isinstance(channel, list) and len(channel) == 2 and isinstance(channel[1], str):
+                    for event in self._waiters.get(tuple(channel), ()):
+                        event.set()
+
+    def _loop(self):
+        with sql_db.db_connect('postgres').cursor() as cr, selectors.DefaultSelector() as sel:
+            cr.execute("listen imbus")
+            cr.commit()
+            conn = cr._cnx
+            sel.register(conn, selectors.EVENT_READ)
+            while True:
+                if sel.select(LONGPOLL_TIMEOUT):
+                    conn.poll()
+                    channels = []
+                    while conn.notifies:
+                        channels.extend(json.loads(conn.notifies.pop().payload))
+                    self._wake(channels)
+
+    def run(self):
+        while True:
+            try:
+                self._loop()
+            except Exception:
+                _logger.exception("Orange Money : erreur dans l'écoute du bus, nouvelle tentative")
+                time.sleep(LONGPOLL_TIMEOUT)
+
+
+_status_dispatch = _StatusDispatch()
+
+
+class OrangeMoneyStatusStreamController(http.Controller):
+    """
+    Statut poussé au portail au lieu de polls répétés.
+
+    Les deux routes doivent être servies par le worker gevent (port longpolling/gevent,
+    comme /websocket côté proxy) : en mode threadé, chaque client en attente occupe un thread.
+    """
+
+    def _read_status(self, db, transaction_id):
+        """Lecture du statut sur un curseur court, indépendant du curseur de la requête."""
+        with sql_db.db_connect(db).cursor() as cr:
+            cr.execute("""
+                SELECT status, updated_at
+                  FROM orange_money_transaction
+                 WHERE transaction_id = %s
+                 LIMIT 1
+            """, (transaction_id,))
+            row = cr.fetchone()
+        if not row:
+            return None
+        return {
+            'transaction_id': transaction_id,
+            'status': row[0],
+            'updated_at': row[1].isoformat() if row[1] else None,
+        }
+
+    def _get_channel(self, transaction_id):
+        return request.env['orange.money.transaction']._get_status_bus_channel(transaction_id)
+
+    @http.route('/api/payment/orange/status/<string:transaction_id>/wait', type='http', auth='public', cors='*', methods=['GET'])
+    def wait_orange_payment_status(self, transaction_id, status=None, timeout=None, **kwargs):
+        """
+        Long-poll : répond dès que le statut diffère de `status` (dernier statut connu du client),
+        ou au bout de `timeout` secondes (50 au plus) avec le statut courant.
+        """
+        db = request.db
+        channel = self._get_channel(transaction_id)
+        current = self._read_status(db, transaction_id)
+        if not current:
+            return self._make_response({'success': False, 'error': 'Transaction not found'}, 404)
+        try:
+            timeout = min(float(timeout or LONGPOLL_TIMEOUT), LONGPOLL_TIMEOUT)
+        except ValueError:
+            timeout = LONGPOLL_TIMEOUT
+
+        def body():
+            deadline = time.monotonic() + timeout
+            # Inscription avant la lecture : aucune notification perdue entre les deux
+            with _status_dispatch.subscribe(db, channel) as event:
+                state = self._read_status(db, transaction_id)
+                while state and state['status'] == status and state['status'] not in TERMINAL_STATUSES:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    event.wait(_status_dispatch.wait_step(remaining))
+                    event.clear()
+                    state = self._read_status(db, transaction_id)
+            yield json.dumps({'success': True, **(state or current)})
+
+        return Response(body(), status=200, headers={'Content-Type': 'application/json'})
+
+    @http.route('/api/payment/orange/status/<string:transaction_id>/events', type='http', auth='public', cors='*', methods=['GET'])
+    def stream_orange_payment_status(self, transaction_id, **kwargs):
+        """
+        Server-Sent Events : un événement `status` à l'ouverture puis à chaque changement ;
+        le flux se ferme sur un statut final (ou après 10 minutes, le navigateur se reconnecte).
+        """
+        db = request.db
+        channel = self._get_channel(transaction_id)
+        current = self._read_status(db, transaction_id)
+        if not current:
+            return self._make_response({'success': False, 'error': 'Transaction not found'}, 404)
+
+        def body():
+            with _status_dispatch.subscribe(db, channel) as event:
+                state = self._read_status(db, transaction_id) or current
+                yield 'retry: 3000\n\n'
+                yield f"event: status\ndata: {json.dumps(state)}\n\n"
+                deadline = time.monotonic() + SSE_MAX_DURATION
+                last_sent = time.monotonic()
+                while state['status'] not in TERMINAL_STATUSES and time.monotonic() < deadline:
+                    event.wait(_status_dispatch.wait_step(SSE_HEARTBEAT))
+                    event.clear()
+                    if time.monotonic() - last_sent >= SSE_HEARTBEAT:
+                        # Commentaire SSE : garde la connexion ouverte à travers les proxys
+                        yield ': keepalive\n\n'
+                        last_sent = time.monotonic()
+                    new_state = self._read_status(db, transaction_id)
+                    if not new_state:
+                        break
+                    if new_state['status'] != state['status']:
+                        state = new_state
+                        yield f"event: status\ndata: {json.dumps(state)}\n\n"
+                        last_sent = time.monotonic()
+
+        return Response(body(), status=200, headers={
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+        })
+
+    def _make_response(self, data, status):
+        return request.make_response(
+            json.dumps(data),
+            status=status,
+            headers={'Content-Type': 'application/json'}
+        )
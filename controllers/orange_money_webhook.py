@@ -309,127 +309,103 @@
 #             _logger.exception("Erreur lors de la réconciliation du paiement: %s", str(e))
 #             return None
 
-from odoo import http, fields
+from odoo import http
 from odoo.http import request
 import json
 import logging
 
 _logger = logging.getLogger(__name__)
 
+# Schéma minimal d'une notification Orange Money, compilé une fois au chargement :
+# (clé, types acceptés, obligatoire)
+_WEBHOOK_SCHEMA = tuple(
+    (key, types if isinstance(types, tuple) else (types,), required)
+    for key, types, required in (
+        ('transactionId', str, True),
+        ('status', str, True),
+        ('amount', (dict, int, float, str), False),
+        ('customer', dict, False),
+        ('partner', dict, False),
+        ('metadata', (dict, str), False),
+    )
+)
+
+
+def _validate_webhook_payload(data):
+    """Retourne un message d'erreur, ou None si la notification est valide."""
+    if not isinstance(data, dict):
+        return 'Le corps doit être un objet JSON'
+    for key, types, required in _WEBHOOK_SCHEMA:
+        value = data.get(key)
+        if value is None:
+            if required:
+                return f'Champ obligatoire manquant : {key}'
+            continue
+        if not isinstance(value, types):
+            return f'Type invalide pour le champ : {key}'
+    return None
+
 
 class OrangeMoneyWebhookController(http.Controller):
     """
-    Webhook Orange Money : simple, idempotent.
+    Webhook Orange Money : on stocke l'événement brut et on acquitte
+    immédiatement ; le traitement est fait par le worker de la boîte de
+    réception (orange.money.webhook.event).
     """
 
     @http.route('/orange/webhook', type='json', auth='public', csrf=False, methods=['POST'])
     def orange_webhook(self, **payload):
         try:
-            data = json.loads(request.httprequest.data)
-            _logger.info("Webhook Orange Money reçu Request : %s", request.httprequest)
-            _logger.info("Webhook Orange Money reçu response http header : %s", request.httprequest.headers)
-            _logger.info(f"Webhook Orange Money reçu : {data}")
-
-            amount_data = data.get('amount')
-            customer = data.get('customer', {}) or {}
-            partner = data.get('partner', {}) or {}
-            channel = data.get('channel')
-            payment_method = data.get('paymentMethod')
-            status = (data.get('status') or '').upper()
-            orange_transaction_id = data.get('transactionId')
-            type_payment = data.get('type')
-            metadata = data.get('metadata', {}) or {}
-
-            _logger.info(f'customer : {customer}')
-            _logger.info(f'partner : {partner}')
-            _logger.info(f"channel : {channel}, payment_method : {payment_method}, "
-                         f"status : {status}, orange_transaction_id : {orange_transaction_id}, "
-                         f"type_payment : {type_payment}")
-            _logger.info(f"metadata : {metadata}")
-
-            # Métadonnées éventuellement stringifiées
-            if isinstance(metadata, str):
-                try:
-                    metadata = json.loads(metadata)
-                except json.JSONDecodeError:
-                    _logger.error("Erreur de décodage JSON dans les métadonnées")
-                    return {'status': 'error', 'message': 'Erreur de décodage JSON dans les métadonnées'}
-
-            # On standardise le champ qui identifie la transaction côté Odoo
-            transaction_id = metadata.get('transaction_id') or metadata.get('reference') or ''
-            if not transaction_id:
-                _logger.error("Aucun transaction_id dans les métadonnées")
-                return {'status': 'error', 'message': 'transaction_id manquant dans les métadonnées'}
-
-            # Recherche de la transaction OM
-            transaction_om = request.env['orange.money.transaction'].sudo().search([
-                ('transaction_id', '=', transaction_id)
-            ], limit=1)
-            _logger.info(f"Transaction trouvée : {transaction_om}")
-            _logger.info(f"Transaction ID : {transaction_id}, Orange Transaction ID : {orange_transaction_id}, Status brut : {status}")
-
-            if not transaction_om:
-                _logger.error(f"Transaction non trouvée pour transaction_id : {transaction_id}")
-                return {'status': 'error', 'message': 'Transaction non trouvée'}
-
-            # Mapping statuts externes -> internes
-            odoo_status = self._map_orange_status_to_odoo(status)
-
-            # Extraction du montant
-            amount_value = None
-            if isinstance(amount_data, dict):
-                amount_value = amount_data.get('value') or amount_data.get('amount')
-            else:
-                amount_value = amount_data
-
-            vals = {
-                'status': odoo_status,
-                'updated_at': fields.Datetime.now(),
-                'webhook_data': json.dumps(data),
-                'transactionId': orange_transaction_id,
-                'channel': channel or '',
-                'payment_method': payment_method or '',
-                'transaction_type': type_payment or '',
-                'partnerId': partner.get('id') or '',
-                'partnerId_type': partner.get('idType') or '',
-                'customer_id': customer.get('id') or '',
-                'customer_id_type': customer.get('idType') or '',
-            }
-
-            # On met à jour le montant si besoin (et si pas déjà renseigné)
-            if amount_value and not transaction_om.amount:
-                try:
-                    vals['amount'] = float(amount_value)
-                except Exception:
-                    _logger.warning(f"Impossible de caster le montant {amount_value} en float")
-
-            # *** Cœur : ce write déclenche toute la logique du modèle ***
-            transaction_om.write(vals)
-
-            # Si statut SUCCESS : le write() du modèle s’occupe de :
-            # - completed_at
-            # - génération du PDF
-            # - création du paiement + réconciliation
-            # - envoi de l’email avec PDF
-            # Et grâce au booléen invoice_sent + completed_at,
-            # plusieurs webhooks SUCCESS ne créent pas de doublons.
-
-            return {'status': 'success', 'message': 'Transaction mise à jour avec succès'}
+            raw_payload = request.httprequest.get_data(as_text=True)
+            if not raw_payload:
+                return {'status': 'error', 'message': 'Corps de requête vide'}
+
+            event = request.env['orange.money.webhook.event'].sudo()._enqueue(raw_payload)
+            if not event:
+                _logger.info("Webhook Orange Money en doublon, acquitté sans traitement")
+                return {'status': 'success', 'message': 'Événement déjà reçu'}
+            _logger.info("Webhook Orange Money reçu, événement %s en file d'attente", event.id)
+            return {'status': 'success', 'message': 'Événement reçu'}
         except Exception as e:
-            _logger.error(f"Erreur lors du traitement du webhook Orange Money : {str(e)}")
+            _logger.error(f"Erreur lors de la réception du webhook Orange Money : {str(e)}")
             return {'status': 'error', 'message': f'Erreur interne du serveur : {str(e)}'}
 
-    def _map_orange_status_to_odoo(self, orange_status: str):
-        """Mapper les statuts Orange Money vers les statuts internes du modèle."""
-        status_mapping = {
-            'SUCCESS': 'SUCCESS',
-            'SUCCEEDED': 'SUCCESS',
-            'FAILED': 'FAILED',
-            'PENDING': 'PENDING',
-            'PROCESSING': 'PENDING',
-            'EXPIRED': 'FAILED',    # EXPIRED -> FAILED
-            'CANCELLED': 'CANCELLED',
-            'CANCELED': 'CANCELLED',
-            'REJECTED': 'REJECTED',
-        }
-        return status_mapping.get((orange_status or '').upper(), 'PENDING')
+    @http.route('/orange/webhook/http', type='http', auth='public', csrf=False, methods=['POST'])
+    def orange_webhook_http(self, **kwargs):
+        """
+        Variante HTTP brute du webhook : un seul décodage JSON, validation
+        par schéma précompilé, et une ligne de log compacte (corps complet en DEBUG).
+        """
+        raw_payload = request.httprequest.get_data(as_text=True)
+        try:
+            data = json.loads(raw_payload)
+        except ValueError:
+            _logger.warning("Webhook Orange Money : corps JSON invalide")
+            return self._make_response({'status': 'error', 'message': 'JSON invalide'}, 400)
+
+        error = _validate_webhook_payload(data)
+        if error:
+            _logger.warning("Webhook Orange Money rejeté : %s", error)
+            return self._make_response({'status': 'error', 'message': error}, 400)
+
+        _logger.info(
+            "Webhook Orange Money : transactionId=%s status=%s",
+            data['transactionId'], data['status']
+        )
+        _logger.debug("Webhook Orange Money, corps complet : %s", raw_payload)
+
+        try:
+            event = request.env['orange.money.webhook.event'].sudo()._enqueue(raw_payload, data)
+        except Exception as e:
+            _logger.error(f"Erreur lors de la réception du webhook Orange Money : {str(e)}")
+            return self._make_response({'status': 'error', 'message': 'Erreur interne du serveur'}, 500)
+
+        message = 'Événement reçu' if event else 'Événement déjà reçu'
+        return self._make_response({'status': 'success', 'message': message}, 200)
+
+    def _make_response(self, data, status):
+        return request.make_response(
+            json.dumps(data),
+            status=status,
+            headers={'Content-Type': 'application/json'}
+        )
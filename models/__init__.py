@@ -1,7 +1,10 @@
-
-
 from . import orange_money_config
 from . import orange_money_transaction
+from . import orange_money_settlement
+from . import orange_money_webhook_event
+from . import orange_money_status_event
+from . import orange_money_payload_archive
+from . import orange_money_transaction_archive
+from . import orange_money_transaction_report
 from . import account_move
-
-
+from . import res_partner
@@ -2,6 +2,8 @@
 
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError, UserError
+from odoo.tools import split_every
+from odoo.tools.sql import column_exists
 import logging
 import requests
 from datetime import datetime
@@ -20,17 +22,17 @@ class AccountMove(models.Model):
         string='Transactions Orange Money'
     )
 
-    # Champs calculés
+    # Totaux stockés, tenus à jour par les transactions (voir _schedule_orange_money_stats)
     orange_money_transaction_count = fields.Integer(
         string='Nombre de transactions OM',
-        compute='_compute_orange_money_stats',
-        store=False
+        readonly=True,
+        copy=False
     )
 
     orange_money_total_paid = fields.Float(
         string='Total payé via Orange Money',
-        compute='_compute_orange_money_stats',
-        store=False
+        readonly=True,
+        copy=False
     )
 
     orange_money_payment_status = fields.Selection([
@@ -38,7 +40,7 @@ class AccountMove(models.Model):
         ('partial', 'Paiement partiel'),
         ('full', 'Entièrement payé'),
         ('overpaid', 'Surpayé')
-    ], string='Statut paiement OM', compute='_compute_orange_money_stats', store=False)
+    ], string='Statut paiement OM', compute='_compute_orange_money_payment_status', store=True)
 
     has_orange_money_config = fields.Boolean(
         string='Configuration OM disponible',
@@ -46,15 +48,10 @@ class AccountMove(models.Model):
         store=False
     )
 
-    @api.depends('orange_money_transaction_ids', 'orange_money_transaction_ids.status', 'orange_money_transaction_ids.amount')
-    def _compute_orange_money_stats(self):
-        """Calculer les statistiques des paiements Orange Money"""
+    @api.depends('orange_money_total_paid', 'amount_total')
+    def _compute_orange_money_payment_status(self):
+        """Déterminer le statut de paiement à partir du total stocké (sans lire les transactions)"""
         for order in self:
-            transactions = order.orange_money_transaction_ids.filtered(lambda t: t.status == 'SUCCESS')
-            order.orange_money_transaction_count = len(order.orange_money_transaction_ids)
-            order.orange_money_total_paid = sum(transactions.mapped('amount'))
-
-            # Déterminer le statut de paiement
             if order.orange_money_total_paid == 0:
                 order.orange_money_payment_status = 'none'
             elif order.orange_money_total_paid < order.amount_total:
@@ -64,6 +61,115 @@ class AccountMove(models.Model):
             else:
                 order.orange_money_payment_status = 'overpaid'
 
+    def _auto_init(self):
+        # Rattrapage des totaux une seule fois, à la création des colonnes : post_init s'exécute
+        # une fois toutes les tables du module créées (transactions et archives comprises)
+        backfill = not column_exists(self.env.cr, self._table, 'orange_money_transaction_count')
+        res = super()._auto_init()
+        if backfill:
+            self.pool.post_init(self._backfill_orange_money_stats)
+        return res
+
+    def _backfill_orange_money_stats(self):
+        self.env.cr.execute("""
+            UPDATE account_move m
+               SET orange_money_transaction_count = COALESCE(s.tx_count, 0),
+                   orange_money_total_paid = COALESCE(s.total_paid, 0)
+              FROM account_move m2
+              LEFT JOIN (
+                    SELECT account_move_id,
+                           COUNT(*) AS tx_count,
+                           SUM(amount) FILTER (WHERE status = 'SUCCESS') AS total_paid
+                      FROM (
+                            SELECT account_move_id, status, amount FROM orange_money_transaction
+                            UNION ALL
+                            SELECT account_move_id, status, amount FROM orange_money_transaction_archive
+                           ) t
+                     WHERE account_move_id IS NOT NULL
+                     GROUP BY account_move_id
+                   ) s ON s.account_move_id = m2.id
+             WHERE m.id = m2.id
+               AND (m.orange_money_transaction_count IS DISTINCT FROM COALESCE(s.tx_count, 0)
+                    OR m.orange_money_total_paid IS DISTINCT FROM COALESCE(s.total_paid, 0))
+        """)
+        if self.env.cr.rowcount:
+            self.env.cr.execute("""
+                UPDATE account_move
+                   SET orange_money_payment_status = CASE
+                       WHEN COALESCE(orange_money_total_paid, 0) = 0 THEN 'none'
+                       WHEN orange_money_total_paid < amount_total THEN 'partial'
+                       WHEN orange_money_total_paid = amount_total THEN 'full'
+                       ELSE 'overpaid'
+                   END
+                 WHERE orange_money_payment_status IS DISTINCT FROM CASE
+                       WHEN COALESCE(orange_money_total_paid, 0) = 0 THEN 'none'
+                       WHEN orange_money_total_paid < amount_total THEN 'partial'
+                       WHEN orange_money_total_paid = amount_total THEN 'full'
+                       ELSE 'overpaid'
+                   END
+            """)
+
+    def _schedule_orange_money_stats(self):
+        """
+        Demander le recalcul des totaux Orange Money de ces factures.
+        Les demandes sont regroupées et traitées une seule fois, juste avant le commit.
+        """
+        if not self:
+            return
+        precommit = self.env.cr.precommit
+        pending = precommit.data.get('orange_money.move_stats')
+        if pending is None:
+            pending = precommit.data['orange_money.move_stats'] = set()
+            precommit.add(self.sudo()._refresh_orange_money_stats)
+        pending.update(self.ids)
+
+    def _refresh_orange_money_stats(self):
+        """
+        Recalculer en une requête groupée les totaux des factures en attente.
+        UPDATE SQL ciblé comme le rattrapage initial : un write() ORM sur une facture postée
+        déclencherait contrôles d'équilibre et synchronisation des lignes, et changerait write_date.
+        """
+        move_ids = self.env.cr.precommit.data.pop('orange_money.move_stats', set())
+        if not move_ids:
+            return
+        self.env['orange.money.transaction'].flush_model(['account_move_id', 'status', 'amount'])
+        self.flush_model(['amount_total'])
+        # Les transactions archivées comptent toujours dans les totaux de la facture
+        self.env.cr.execute("""
+            UPDATE account_move m
+               SET orange_money_transaction_count = s.tx_count,
+                   orange_money_total_paid = s.total_paid,
+                   orange_money_payment_status = CASE
+                       WHEN s.total_paid = 0 THEN 'none'
+                       WHEN s.total_paid < m.amount_total THEN 'partial'
+                       WHEN s.total_paid = m.amount_total THEN 'full'
+                       ELSE 'overpaid'
+                   END
+              FROM (
+                    SELECT mv.id,
+                           COUNT(t.account_move_id) AS tx_count,
+                           COALESCE(SUM(t.amount) FILTER (WHERE t.status = 'SUCCESS'), 0) AS total_paid
+                      FROM unnest(%s) AS mv(id)
+                      LEFT JOIN (
+                            SELECT account_move_id, status, amount FROM orange_money_transaction
+                             WHERE account_move_id = ANY(%s)
+                            UNION ALL
+                            SELECT account_move_id, status, amount FROM orange_money_transaction_archive
+                             WHERE account_move_id = ANY(%s)
+                           ) t ON t.account_move_id = mv.id
+                     GROUP BY mv.id
+                   ) s
+             WHERE m.id = s.id
+               AND (m.orange_money_transaction_count IS DISTINCT FROM s.tx_count
+                    OR m.orange_money_total_paid IS DISTINCT FROM s.total_paid)
+            RETURNING m.id
+        """, (list(move_ids), list(move_ids), list(move_ids)))
+        updated = self.browse([row[0] for row in self.env.cr.fetchall()])
+        if updated:
+            updated.invalidate_recordset([
+                'orange_money_transaction_count', 'orange_money_total_paid', 'orange_money_payment_status',
+            ])
+
     def _compute_has_orange_money_config(self):
         """Vérifier si une configuration Orange Money est disponible"""
         for order in self:
@@ -187,6 +293,215 @@ class AccountMove(models.Model):
             _logger.error(f"Erreur lors de l'initiation du paiement Orange Money: {str(e)}")
             return {'error': str(e), 'success': False}
 
+    # ============================
+    # INITIATION EN LOT
+    # ============================
+    # Factures traitées par paquet : réservations, QR générés en parallèle, puis enregistrement
+    _OM_BULK_CHUNK_SIZE = 50
+
+    def _get_orange_money_open_transactions(self):
+        """Transactions qui rendent une nouvelle initiation inutile : payée, ou QR encore valide."""
+        return self.env['orange.money.transaction'].sudo().search([
+            ('account_move_id', 'in', self.ids),
+            '|',
+            ('status', '=', 'SUCCESS'),
+            '&',
+            ('status', 'in', ['PRE_INITIATED', 'INITIATED', 'PENDING', 'ACCEPTED']),
+            '|', ('valid_until', '=', False), ('valid_until', '>', fields.Datetime.now()),
+        ])
+
+    def _prepare_orange_money_transaction_vals(self, payment_data, qr_info, config, metadata=None):
+        self.ensure_one()
+        return {
+            'metadata': metadata,
+            'success_url': payment_data['success_url'],
+            'cancel_url': payment_data['success_url'],
+            'pay_token': qr_info.get('pay_token'),
+            'transaction_id': payment_data['transaction_id'],
+            'amount': payment_data['amount'],
+            'currency': payment_data['currency'],
+            'status': 'INITIATED',
+            'customer_msisdn': payment_data['phone_number'],
+            'merchant_code': config.merchant_code,
+            'reference': payment_data['reference'],
+            'description': payment_data['description'],
+            'payment_url': qr_info.get('payment_url'),
+            'qr_code_url': qr_info.get('deep_link'),
+            'qr_code_base64': qr_info.get('qr_code_base64'),
+            'qr_id': qr_info.get('qr_id'),
+            'orange_id': qr_info.get('qr_id'),
+            'deep_link': qr_info.get('deep_link'),
+            'deep_link_om': qr_info.get('deep_link_om'),
+            'deep_link_maxit': qr_info.get('deep_link_maxit'),
+            'short_link': qr_info.get('short_link'),
+            'validity_seconds': qr_info.get('validity_seconds'),
+            'valid_from': qr_info.get('valid_from'),
+            'valid_until': qr_info.get('valid_until'),
+            'orange_response': qr_info.get('orange_response'),
+            'callback_url': qr_info.get('callback_url'),
+            'account_move_id': self.id,
+            'partner_id': self.partner_id.id,
+        }
+
+    def _orange_money_bulk_initiate(self, commit=True):
+        """
+        Initier un paiement Orange Money pour chaque facture du recordset.
+
+        Les factures déjà payées ou ayant un QR encore valide sont ignorées : relancer
+        l'opération après une interruption ne traite que ce qui reste. Une réservation
+        PRE_INITIATED orpheline est libérée et la facture réinitiée ; une réservation récente
+        (initiation concurrente) est signalée en échec avec in_progress=True. Chaque paquet suit les
+        phases de /initiate (réservation, appels QR, enregistrement) et chaque facture a son
+        propre résultat ; avec commit=True, la réservation puis le résultat sont validés.
+        Retourne {account_move_id: {'success': ..., 'transaction_id'|'message': ...}}.
+        """
+        results = {}
+        config = self.env['orange.money.config'].sudo().search([('is_active', '=', True)], limit=1)
+        if not config:
+            return {move.id: {'success': False, 'message': 'Aucune configuration Orange Money active trouvée.'} for move in self}
+
+        to_initiate = self.browse()
+        for move in self:
+            validation = move._validate_orange_money_payment()
+            if validation['success']:
+                to_initiate |= move
+            else:
+                results[move.id] = {'success': False, 'message': validation['message']}
+
+        stale = self.env['orange.money.transaction'].sudo().browse()
+        for transaction in to_initiate._get_orange_money_open_transactions():
+            if transaction.status == 'PRE_INITIATED':
+                # Réservation sans QR : orpheline, elle est libérée et la facture réinitiée ;
+                # sinon une autre initiation est en cours et la facture n'a pas encore de QR
+                if transaction._is_stale_reservation():
+                    stale |= transaction
+                    continue
+                results[transaction.account_move_id.id] = {
+                    'success': False,
+                    'in_progress': True,
+                    'transaction_id': transaction.transaction_id,
+                    'message': 'Initiation déjà en cours, réessayez dans un instant.',
+                }
+                continue
+            results[transaction.account_move_id.id] = {
+                'success': True,
+                'existing': True,
+                'transaction_id': transaction.transaction_id,
+                'status': transaction.status,
+            }
+        if stale:
+            stale.unlink()
+        to_initiate = to_initiate.filtered(lambda m: m.id not in results)
+
+        Transaction = self.env['orange.money.transaction'].sudo().with_context(
+            mail_create_nolog=True, om_status_source='api'
+        )
+        for chunk_ids in split_every(self._OM_BULK_CHUNK_SIZE, to_initiate.ids):
+            moves = self.browse(chunk_ids)
+
+            # Phase 1 : réserver une ligne PRE_INITIATED par facture, comme /initiate, en un create
+            jobs = []
+            for move in moves:
+                payment_data = move._prepare_payment_data(move._generate_transaction_id())
+                metadata = config._prepare_invoice_qr_metadata(
+                    move.id, payment_data['transaction_id'], payment_data['phone_number'],
+                    payment_data['description'], payment_data['reference'], payment_data['success_url'],
+                )
+                payload = config._prepare_qr_payload(
+                    payment_data['amount'], metadata=metadata,
+                    success_url=payment_data['success_url'], cancel_url=payment_data['success_url'],
+                )
+                jobs.append((move, payment_data, metadata, payload))
+            jobs = self._reserve_orange_money_transactions(Transaction, jobs, config, results)
+            if commit:
+                self.env.cr.commit()
+
+            # Phase 2 : QR générés en parallèle, hors de toute écriture
+            responses = config._request_qr_codes([payload for _move, _data, _metadata, _reservation, payload in jobs])
+
+            # Phase 3 : chaque réservation reçoit son QR dans son propre savepoint
+            released = Transaction.browse()
+            for (move, payment_data, metadata, reservation, _payload), (ok, response) in zip(jobs, responses):
+                if ok:
+                    try:
+                        with self.env.cr.savepoint():
+                            reservation.write(move._prepare_orange_money_transaction_vals(
+                                payment_data, config._parse_qr_data(response), config, metadata
+                            ))
+                        results[move.id] = {
+                            'success': True,
+                            'transaction_id': reservation.transaction_id,
+                            'status': reservation.status,
+                        }
+                        continue
+                    except Exception as e:
+                        response = str(e)
+                _logger.error("Initiation Orange Money en lot échouée pour la facture %s : %s", move.name, response)
+                results[move.id] = {'success': False, 'message': response}
+                released |= reservation
+            # Réservations sans QR : supprimées, une relance pourra les réinitier
+            if released:
+                with self.env.cr.savepoint():
+                    released.unlink()
+            if commit:
+                self.env.cr.commit()
+            _logger.info(
+                "Initiation Orange Money en lot : %s QR créé(s) sur %s facture(s)",
+                len(jobs) - len(released), len(moves)
+            )
+        return results
+
+    def _reserve_orange_money_transactions(self, Transaction, jobs, config, results):
+        """
+        Créer en une fois les réservations PRE_INITIATED des jobs (move, payment_data, metadata, payload).
+        Si le lot échoue (ex. doublon), reprise facture par facture pour isoler les erreurs.
+        Retourne les jobs réservés, complétés de leur transaction : (move, payment_data, metadata, transaction, payload).
+        """
+        vals_list = [
+            dict(move._prepare_orange_money_transaction_vals(payment_data, {}, config, metadata), status='PRE_INITIATED')
+            for move, payment_data, metadata, _payload in jobs
+        ]
+        try:
+            with self.env.cr.savepoint():
+                reservations = Transaction.create(vals_list)
+            return [
+                (move, payment_data, metadata, reservation, payload)
+                for (move, payment_data, metadata, payload), reservation in zip(jobs, reservations)
+            ]
+        except Exception as e:
+            _logger.warning(
+                "Réservation en lot de %s transactions Orange Money échouée (%s), reprise facture par facture.",
+                len(jobs), str(e)
+            )
+        reserved = []
+        for (move, payment_data, metadata, payload), vals in zip(jobs, vals_list):
+            try:
+                with self.env.cr.savepoint():
+                    reservation = Transaction.create(vals)
+            except Exception as e:
+                _logger.error("Réservation Orange Money en lot échouée pour la facture %s : %s", move.name, str(e))
+                results[move.id] = {'success': False, 'message': str(e)}
+                continue
+            reserved.append((move, payment_data, metadata, reservation, payload))
+        return reserved
+
+    def action_bulk_initiate_orange_money_payment(self):
+        """Action serveur (liste des factures) : initier les paiements Orange Money en lot."""
+        results = self._orange_money_bulk_initiate()
+        failed = self.filtered(lambda m: not results.get(m.id, {}).get('success'))
+        created = sum(1 for res in results.values() if res.get('success') and not res.get('existing'))
+        existing = sum(1 for res in results.values() if res.get('existing'))
+        message = f'{created} QR créé(s), {existing} déjà en cours ou payé(s), {len(failed)} échec(s).'
+        if failed:
+            message += '\n' + '\n'.join(
+                f"{move.name} : {results.get(move.id, {}).get('message', 'Erreur inconnue')}" for move in failed[:20]
+            )
+        return self._show_notification(
+            'Initiation Orange Money en lot',
+            message,
+            'warning' if failed else 'success'
+        )
+
     def _handle_existing_transaction(self, existing_tx, payment_data):
         """Gérer une transaction existante"""
         return {
@@ -269,8 +584,8 @@ class AccountMove(models.Model):
             'validity_seconds': data.get('validitySeconds'),
             'valid_from': data.get('validFrom'),
             'valid_until': data.get('validUntil'),
-            'orange_response': json.dumps(data),
-            'metadata': json.dumps(data.get('metadata', {})),
+            'orange_response': data,
+            'metadata': data.get('metadata', {}),
             'account_move_id': self.id,
             'partner_id': self.partner_id.id,
             'orange_id': data.get('qrId'),
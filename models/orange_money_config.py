@@ -5,12 +5,77 @@ import base64
 from datetime import datetime, timedelta
 import logging
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from datetime import datetime
 
 
 _logger = logging.getLogger(__name__)
 
+
+class _StatusCache:
+    """
+    Cache (par processus) des statuts renvoyés par Orange, à durée de vie courte,
+    avec un seul appel en vol par clé : les requêtes concurrentes attendent le résultat.
+    """
+
+    def __init__(self, maxsize=4096, wait_timeout=35):
+        self.maxsize = maxsize
+        self.wait_timeout = wait_timeout
+        self._data = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _get_fresh(self, key):
+        entry = self._data.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    def get_or_fetch(self, key, fetch, ttl):
+        with self._lock:
+            value = self._get_fresh(key)
+            if value is not None:
+                return value
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = self._inflight[key] = threading.Event()
+
+        if not leader:
+            event.wait(self.wait_timeout)
+            with self._lock:
+                value = self._get_fresh(key)
+            if value is not None:
+                return value
+            # L'appel partagé a échoué : on tente le nôtre, sans coalescence
+            return fetch()
+
+        value = None
+        try:
+            value = fetch()
+            return value
+        finally:
+            with self._lock:
+                # Seules les réponses valides sont partagées et mises en cache
+                if value and value.get('success') and ttl > 0:
+                    if len(self._data) >= self.maxsize:
+                        now = time.monotonic()
+                        self._data = {k: v for k, v in self._data.items() if v[0] > now}
+                    self._data[key] = (time.monotonic() + ttl, value)
+                self._inflight.pop(key, None)
+                event.set()
+
+
+_status_cache = _StatusCache()
+
+# Appels simultanés vers Orange au plus, pour une vérification de statut en lot
+STATUS_BATCH_WORKERS = 8
+# Générations de QR simultanées au plus, pour une initiation en lot
+QR_BATCH_WORKERS = 4
+
 class OrangeMoneyConfig(models.Model):
     _name = 'orange.money.config'
     _description = 'Configuration Orange Money'
@@ -147,6 +212,89 @@ class OrangeMoneyConfig(models.Model):
         help="Dernière réponse reçue lors de la configuration du webhook."
     )
 
+    # Comptabilisation
+    settlement_mode = fields.Selection([
+        ('payment', 'Un paiement par transaction'),
+        ('daily', 'Écriture de règlement journalière'),
+    ], string='Mode de comptabilisation', default='payment', required=True,
+        help="En mode journalier, les paiements du jour sont comptabilisés en une seule écriture "
+             "agrégée (une ligne par facture) au lieu d'un account.payment par transaction.")
+
+    chatter_on_automated_transitions = fields.Boolean(
+        string='Chatter pour les transitions automatiques',
+        default=True,
+        help="Si décoché, les créations et changements de statut venant des webhooks, polls et crons "
+             "ne sont tracés que dans le journal des statuts, sans message dans le chatter."
+    )
+
+    settlement_journal_id = fields.Many2one(
+        'account.journal',
+        string='Journal de règlement',
+        domain="[('type', 'in', ['bank', 'cash'])]",
+        help="Journal Orange Money utilisé pour les écritures journalières (rapprochement avec le relevé Orange)"
+    )
+
+    status_cache_ttl = fields.Integer(
+        string='Durée du cache statut (s)',
+        default=5,
+        help="Durée pendant laquelle un statut lu chez Orange est réutilisé par les polls du portail "
+             "(0 = pas de cache). Les polls simultanés d'une même transaction partagent un seul appel."
+    )
+
+    expiry_grace_minutes = fields.Integer(
+        string="Délai avant expiration (min)",
+        default=5,
+        help="Marge après la fin de validité du QR avant de clôturer la transaction en échec"
+    )
+
+    expiry_verify_upstream = fields.Boolean(
+        string="Vérifier chez Orange avant expiration",
+        default=True,
+        help="Interroger Orange (en lot) avant de clôturer les transactions expirées, "
+             "pour rattraper un paiement validé au dernier moment. Sans vérification, "
+             "un SUCCESS reçu ensuite rouvre quand même la transaction expirée."
+    )
+
+    reservation_timeout_minutes = fields.Integer(
+        string="Réservation orpheline après (min)",
+        default=2,
+        help="Une initiation restée PRE_INITIATED plus longtemps a été interrompue : "
+             "elle est reprise par le prochain appel /initiate ou supprimée par le cron d'expiration."
+    )
+
+    partner_snapshot_threshold = fields.Integer(
+        string='Seuil instantané client',
+        default=0,
+        help="À partir de ce nombre de transactions, les statistiques Orange Money d'un client "
+             "sont lues dans un instantané rafraîchi par le cron (0 = toujours calculées en direct)."
+    )
+
+    # Rétention
+    payload_retention_days = fields.Integer(
+        string="Rétention des réponses brutes (jours)",
+        default=0,
+        help="Au-delà, les réponses Orange, données webhook et QR des transactions finales sont "
+             "retirés de la table des transactions, et les webhooks traités supprimés (0 = conservés)."
+    )
+
+    payload_retention_mode = fields.Selection([
+        ('archive', 'Archiver (compressé)'),
+        ('purge', 'Supprimer'),
+    ], string="Réponses brutes expirées", default='archive', required=True)
+
+    retention_purge_receipts = fields.Boolean(
+        string="Supprimer aussi les reçus PDF",
+        default=False,
+        help="Supprimer les reçus PDF (et leur lien public) passé la durée de rétention des réponses brutes."
+    )
+
+    transaction_archive_days = fields.Integer(
+        string="Archivage des transactions (jours)",
+        default=0,
+        help="Au-delà, les transactions finales sont déplacées vers la table d'archive ; "
+             "l'analyse des transactions couvre les deux tables (0 = jamais)."
+    )
+
 
     @api.depends('is_active')
     def _compute_transaction_stats(self):
@@ -165,10 +313,33 @@ class OrangeMoneyConfig(models.Model):
             if other_active:
                 raise ValidationError("Une seule configuration Orange Money peut être active à la fois.")
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        # Cache de la configuration active (orange.money.transaction._chatter_on_automated_transitions)
+        self.env['orange.money.transaction'].clear_caches()
+        return records
+
     def write(self, vals):
         """Mettre à jour la date de modification"""
         vals['updated_at'] = fields.Datetime.now()
-        return super().write(vals)
+        res = super().write(vals)
+        if 'chatter_on_automated_transitions' in vals or 'is_active' in vals:
+            self.env['orange.money.transaction'].clear_caches()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env['orange.money.transaction'].clear_caches()
+        return res
+
+    def _get_settlement_journal(self):
+        """Journal des écritures journalières (à défaut, le premier journal bank/cash de la société)."""
+        self.ensure_one()
+        return self.settlement_journal_id or self.env['account.journal'].search([
+            ('type', 'in', ['bank', 'cash']),
+            ('company_id', '=', self.env.company.id)
+        ], limit=1)
 
 
 
@@ -258,49 +429,75 @@ class OrangeMoneyConfig(models.Model):
     def generate_qr_code(self, amount, validity=3600, metadata=None , success_url=None, cancel_url=None):
         """Générer un QR code pour paiement marchand"""
         try:
-            token = self._get_access_token()
-            public_key = self.get_public_key()
-            
-            # api/payment/callback/<string:transactionId>
-            callback_url =  self.callback_notification_url or f"https://intanet.toubasandaga.sn/orange/webhook"
-            
-            headers = {
-                'Authorization': f'Bearer {token}',
-                'Content-Type': 'application/json',
-                'X-Callback-Url': callback_url, 
-                'X-Api-Key': public_key
-            }
+            headers = self._prepare_qr_headers()
+            payload = self._prepare_qr_payload(amount, validity, metadata, success_url, cancel_url)
+            return self._request_qr_code(self.base_url, headers, payload)
+        except Exception as e:
+            raise Exception(f"Erreur lors de la génération du QR code: {str(e)}")
 
-            _logger.info(f"header : {headers}"  )
+    def _prepare_qr_headers(self):
+        """En-têtes de l'appel QR (token et clé publique) : à préparer une fois par lot."""
+        token = self._get_access_token()
+        # Clé publique conservée en base : pas d'aller-retour Orange à chaque QR
+        public_key = self.public_key or self.get_public_key()
 
-            payload = {
-                'amount': {
-                    'unit': self.default_currency,
-                    'value': int(amount)
-                },
-                'code': self.merchant_code,
-                'name': self.merchant_name,
-                'validity': validity,  # en secondes, max 86400
-                'callbackSuccessUrl': success_url,
-                'callbackCancelUrl': cancel_url,
-                'metadata': metadata or {}
-            }
-            _logger.info(f"Payload : {payload} "  )
+        # api/payment/callback/<string:transactionId>
+        callback_url = self.callback_notification_url or f"https://intanet.toubasandaga.sn/orange/webhook"
 
-            response = requests.post(
-                f"{self.base_url}/api/eWallet/v4/qrcode",
-                json=payload,
-                headers=headers,
-                timeout=30
-            )
-            
-            if response.status_code in [200, 201]:
-                return response.json()
-            else:
-                raise Exception(f"Erreur API Orange Money: {response.status_code} - {response.text}")
-                
-        except Exception as e:
-            raise Exception(f"Erreur lors de la génération du QR code: {str(e)}")
+        return {
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'application/json',
+            'X-Callback-Url': callback_url,
+            'X-Api-Key': public_key
+        }
+
+    def _prepare_qr_payload(self, amount, validity=3600, metadata=None, success_url=None, cancel_url=None):
+        payload = {
+            'amount': {
+                'unit': self.default_currency,
+                'value': int(amount)
+            },
+            'code': self.merchant_code,
+            'name': self.merchant_name,
+            'validity': validity,  # en secondes, max 86400
+            'callbackSuccessUrl': success_url,
+            'callbackCancelUrl': cancel_url,
+            'metadata': metadata or {}
+        }
+        _logger.info(f"Payload : {payload} "  )
+        return payload
+
+    @api.model
+    def _request_qr_code(self, base_url, headers, payload):
+        """Appel HTTP seul (aucun accès base) : réponse JSON d'Orange, ou exception."""
+        response = requests.post(
+            f"{base_url}/api/eWallet/v4/qrcode",
+            json=payload,
+            headers=headers,
+            timeout=30
+        )
+        if response.status_code in [200, 201]:
+            return response.json()
+        raise Exception(f"Erreur API Orange Money: {response.status_code} - {response.text}")
+
+    def _request_qr_codes(self, payloads):
+        """
+        Générer plusieurs QR en parallèle (QR_BATCH_WORKERS au plus, pour rester sous les
+        limites de débit d'Orange). Retourne une liste (succès, réponse ou message) dans l'ordre.
+        """
+        if not payloads:
+            return []
+        base_url, headers = self.base_url, self._prepare_qr_headers()
+
+        def call(payload):
+            try:
+                return True, self._request_qr_code(base_url, headers, payload)
+            except Exception as e:
+                return False, str(e)
+
+        workers = min(QR_BATCH_WORKERS, len(payloads))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='orange_money_qr') as executor:
+            return list(executor.map(call, payloads))
 
 
     def get_public_key(self):
@@ -338,37 +535,86 @@ class OrangeMoneyConfig(models.Model):
             raise Exception(f"Erreur lors de l'obtention de la clé publique: {str(e)}")
         
 
-    def get_transaction_status(self, transactionId):
+    @api.model
+    def _fetch_transaction_status(self, base_url, token, transactionId):
         """
-        Vérifier le statut d'une transaction via l'API Orange Money
-        et mettre à jour la transaction correspondante dans Odoo.
+        Appel HTTP seul (aucun accès base) : {'success': True, 'data': ...}
+        ou {'success': False, 'message': ...}.
         """
+        headers = {
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'application/json',
+            'Accept': 'application/json'
+        }
+        url = f"{base_url}/api/eWallet/v1/transactions?transactionId={transactionId}"
+        _logger.info(f"Requête GET vers {url}")
         try:
-            _logger.info(f"Vérification du statut pour transaction_id : {transactionId}")
+            response = requests.get(url, headers=headers, timeout=30)
+        except requests.exceptions.Timeout:
+            _logger.error("Timeout lors de l'appel à l'API Orange Money")
+            return {'success': False, 'message': 'Timeout lors de l\'appel à l\'API Orange Money'}
 
-            token = self._get_access_token()
-            headers = {
-                'Authorization': f'Bearer {token}',
-                'Content-Type': 'application/json',
-                'Accept': 'application/json'
+        _logger.info(f"Réponse API - Status Code : {response.status_code}")
+        _logger.debug(f"Contenu brut : {response.text}")
+
+        if response.status_code != 200:
+            _logger.error(f"Erreur API Orange Money : {response.status_code} - {response.text}")
+            return {
+                'success': False,
+                'message': f"Erreur API : {response.status_code} - {response.text}"
             }
+        return {'success': True, 'data': response.json()}
 
-            url = f"{self.base_url}/api/eWallet/v1/transactions?transactionId={transactionId}"
-            _logger.info(f"Requête GET vers {url} avec headers {headers}")
+    def _fetch_transaction_statuses(self, transactionIds, use_cache=True):
+        """
+        Statuts Orange de plusieurs transactions, interrogés en parallèle (STATUS_BATCH_WORKERS
+        au plus). Les threads ne font que du HTTP : le token est obtenu avant, aucun accès base.
+        Retourne {transactionId: résultat de _fetch_transaction_status}.
+        """
+        self.ensure_one()
+        transactionIds = list(dict.fromkeys(transactionIds))
+        if not transactionIds:
+            return {}
+        base_url, token = self.base_url, self._get_access_token()
+        key_prefix = (self.env.cr.dbname, self.id)
+        ttl = self.status_cache_ttl if use_cache else 0
+
+        def fetch(transactionId):
+            def call():
+                return self._fetch_transaction_status(base_url, token, transactionId)
+            try:
+                return _status_cache.get_or_fetch(key_prefix + (transactionId,), call, ttl)
+            except Exception as e:
+                return {'success': False, 'message': str(e)}
+
+        workers = min(STATUS_BATCH_WORKERS, len(transactionIds))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='orange_money_status') as executor:
+            return dict(zip(transactionIds, executor.map(fetch, transactionIds)))
+
+    def get_transaction_status(self, transactionId, use_cache=False):
+        """
+        Vérifier le statut d'une transaction via l'API Orange Money
+        et mettre à jour la transaction correspondante dans Odoo.
 
-            response = requests.get(url, headers=headers, timeout=30)
+        use_cache=True (polls du portail) : réponse partagée pendant status_cache_ttl secondes
+        et un seul appel à Orange pour des polls simultanés de la même transaction.
+        """
+        try:
+            _logger.info(f"Vérification du statut pour transaction_id : {transactionId}")
 
-            _logger.info(f"Réponse API - Status Code : {response.status_code}")
-            _logger.debug(f"Contenu brut : {response.text}")
+            def fetch():
+                return self._fetch_transaction_status(self.base_url, self._get_access_token(), transactionId)
 
-            if response.status_code != 200:
-                _logger.error(f"Erreur API Orange Money : {response.status_code} - {response.text}")
-                return {
-                    'success': False,
-                    'message': f"Erreur API : {response.status_code} - {response.text}"
-                }
+            if use_cache:
+                result = _status_cache.get_or_fetch(
+                    (self.env.cr.dbname, self.id, transactionId), fetch, self.status_cache_ttl
+                )
+            else:
+                result = fetch()
+            if not result.get('success'):
+                return result
 
-            data = response.json()
+            data = result['data']
             status = data.get('status', '').upper()
             _logger.info(f"Statut retourné : {status}")
 
@@ -386,12 +632,12 @@ class OrangeMoneyConfig(models.Model):
                 }
 
             # Mettre à jour la transaction si le statut a changé
+            status = transaction._map_orange_status(status)
             if transaction.status != status:
                 _logger.info(f"Mise à jour de la transaction {transactionId} : {transaction.status} -> {status}")
-                transaction.write({
-                    'status': status,
+                transaction._set_status(status, {
                     'updated_at': fields.Datetime.now(),
-                    'orange_response': json.dumps(data)
+                    'orange_response': data
                 })
             else:
                 _logger.info(f"Aucun changement de statut pour {transactionId} (statut actuel : {transaction.status})")
@@ -403,10 +649,6 @@ class OrangeMoneyConfig(models.Model):
                 'orange_response': data
             }
 
-        except requests.exceptions.Timeout:
-            _logger.error("Timeout lors de l'appel à l'API Orange Money")
-            return {'success': False, 'message': 'Timeout lors de l\'appel à l\'API Orange Money'}
-
         except Exception as e:
             _logger.error(f"Erreur inattendue : {str(e)}")
             return {'success': False, 'message': f'Erreur inattendue : {str(e)}'}
@@ -442,7 +684,7 @@ class OrangeMoneyConfig(models.Model):
                     old_status = self.status
                     self.write({
                         'status': status,
-                        'orange_response': json.dumps(status_data),
+                        'orange_response': status_data,
                         'status_reason': status_data.get('statusReason', ''),
                     })
                     
@@ -491,14 +733,9 @@ class OrangeMoneyConfig(models.Model):
         Cette méthode est appelée par le contrôleur.
         """
         try:
-            metadata = {
-                "account_move_id": str(account_move_id),
-                "transaction_id": transaction_id,
-                "customer_msisdn": customer_msisdn,
-                "description": description,
-                "reference": reference,
-                "success_url": success_url,
-            }
+            metadata = self._prepare_invoice_qr_metadata(
+                account_move_id, transaction_id, customer_msisdn, description, reference, success_url
+            )
             
             # Appeler la méthode existante pour générer le QR code
             qr_data = self.generate_qr_code(
@@ -510,59 +747,55 @@ class OrangeMoneyConfig(models.Model):
             _logger.info(f"QR data: {qr_data}")
            
             if qr_data:
-                # Extraire toutes les informations pertinentes de la réponse Orange Money
-                deep_links = qr_data.get('deepLinks', {})
-                valid_for = qr_data.get('validFor', {})
-                deep_link = qr_data.get('deepLink')
-                maxit = qr_data.get('deepLinks', {}).get('MAXIT')
-                om = qr_data.get('deepLinks', {}).get('OM')
-                qr_code = qr_data.get('qrCode')
-                qr_id = qr_data.get('qrId')
-                short_link = qr_data.get('shortLink')
-                validity = qr_data.get('validity')
-                valid_for = qr_data.get('validFor', {})
-                end_date_time = valid_for.get('endDateTime')
-                start_date_time = valid_for.get('startDateTime')
-                callback_url = self.callback_notification_url
-            
-
-                # Convertir les dates au format correct
-                def format_datetime(dt_str):
-                    if dt_str:
-                        dt = datetime.strptime(dt_str, '%Y-%m-%dT%H:%M:%S.%f')
-                        return dt.strftime('%Y-%m-%d %H:%M:%S')
-                    return None
-
-                start_date_time = format_datetime(start_date_time)
-                end_date_time = format_datetime(end_date_time)
-
-
-                # api_transaction_model = self.env['orange.money.api.transaction']
-                # api_transaction_model.fetch_all_transactions()
-
-
-                return {
-                    'success': True,
-                    'pay_token': qr_id,
-                    'qr_id': qr_id,
-                    'payment_url': deep_link,
-                    'deep_link': deep_link,
-                    'qr_code_base64': qr_code,
-                    'deep_link_om': om,
-                    'deep_link_maxit': maxit,
-                    'short_link': short_link,
-                    'validity_seconds': validity,
-                    'valid_from': start_date_time,
-                    'valid_until': end_date_time,
-                    'orange_response': json.dumps(qr_data),
-                    'callback_url': callback_url
-                }
+                return self._parse_qr_data(qr_data)
             else:
                 return {'success': False, 'message': 'Failed to generate QR code'}
         except Exception as e:
             _logger.error(f"Error in create_payment_order: {str(e)}")
             return {'success': False, 'message': str(e)}
 
+    @api.model
+    def _prepare_invoice_qr_metadata(self, account_move_id, transaction_id, customer_msisdn, description, reference, success_url):
+        return {
+            "account_move_id": str(account_move_id),
+            "transaction_id": transaction_id,
+            "customer_msisdn": customer_msisdn,
+            "description": description,
+            "reference": reference,
+            "success_url": success_url,
+        }
+
+    def _parse_qr_data(self, qr_data):
+        """Réponse QR d'Orange -> valeurs utilisées pour créer la transaction."""
+        valid_for = qr_data.get('validFor', {})
+        deep_links = qr_data.get('deepLinks', {})
+        deep_link = qr_data.get('deepLink')
+        qr_id = qr_data.get('qrId')
+
+        # Convertir les dates au format correct
+        def format_datetime(dt_str):
+            if dt_str:
+                dt = datetime.strptime(dt_str, '%Y-%m-%dT%H:%M:%S.%f')
+                return dt.strftime('%Y-%m-%d %H:%M:%S')
+            return None
+
+        return {
+            'success': True,
+            'pay_token': qr_id,
+            'qr_id': qr_id,
+            'payment_url': deep_link,
+            'deep_link': deep_link,
+            'qr_code_base64': qr_data.get('qrCode'),
+            'deep_link_om': deep_links.get('OM'),
+            'deep_link_maxit': deep_links.get('MAXIT'),
+            'short_link': qr_data.get('shortLink'),
+            'validity_seconds': qr_data.get('validity'),
+            'valid_from': format_datetime(valid_for.get('startDateTime')),
+            'valid_until': format_datetime(valid_for.get('endDateTime')),
+            'orange_response': qr_data,
+            'callback_url': self.callback_notification_url
+        }
+
     def get_payment_status_by_token(self, pay_token):
         """
         Récupère le statut d'une transaction Orange Money en utilisant le pay_token.
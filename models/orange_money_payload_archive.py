@@ -0,0 +1,84 @@
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+import base64
+import json
+import logging
+import zlib
+
+_logger = logging.getLogger(__name__)
+
+
+class OrangeMoneyPayloadArchive(models.Model):
+    """
+    Réponses brutes Orange (orange_response, webhook_data) retirées des transactions
+    après la durée de rétention, conservées compressées hors de la table chaude.
+    """
+    _name = 'orange.money.payload.archive'
+    _description = 'Archive des réponses brutes Orange Money'
+    _order = 'archived_at desc, id desc'
+    _log_access = False
+
+    transaction_id = fields.Many2one(
+        'orange.money.transaction',
+        string="Transaction",
+        index=True,
+        ondelete='set null',
+        readonly=True
+    )
+
+    transaction_ref = fields.Char(
+        string="ID de transaction",
+        index=True,
+        readonly=True
+    )
+
+    archived_at = fields.Datetime(
+        string="Archivé le",
+        required=True,
+        default=fields.Datetime.now,
+        readonly=True
+    )
+
+    payload = fields.Binary(
+        string="Contenu compressé",
+        attachment=False,
+        readonly=True,
+        help="JSON {champ: valeur} compressé (zlib)"
+    )
+
+    payload_text = fields.Text(
+        string="Contenu",
+        compute='_compute_payload_text'
+    )
+
+    def _compute_payload_text(self):
+        for record in self:
+            try:
+                record.payload_text = json.dumps(record._get_payload(), indent=2, ensure_ascii=False)
+            except (ValueError, zlib.error):
+                record.payload_text = False
+
+    def _get_payload(self):
+        self.ensure_one()
+        if not self.payload:
+            return {}
+        return json.loads(zlib.decompress(base64.b64decode(self.payload)))
+
+    def write(self, vals):
+        raise UserError("Les archives Orange Money ne peuvent pas être modifiées.")
+
+    @api.model
+    def _archive_payloads(self, transactions, field_names):
+        """Une archive compressée par transaction, pour les champs non vides."""
+        vals_list = []
+        for transaction in transactions:
+            content = {name: transaction[name] for name in field_names if transaction[name]}
+            if not content:
+                continue
+            compressed = zlib.compress(json.dumps(content).encode('utf-8'), 9)
+            vals_list.append({
+                'transaction_id': transaction.id,
+                'transaction_ref': transaction.transaction_id,
+                'payload': base64.b64encode(compressed),
+            })
+        return self.sudo().create(vals_list)
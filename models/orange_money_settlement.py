@@ -0,0 +1,222 @@
+from odoo import models, fields, api
+from odoo.exceptions import ValidationError
+import logging
+from collections import defaultdict
+
+_logger = logging.getLogger(__name__)
+
+
+class OrangeMoneySettlement(models.Model):
+    _name = 'orange.money.settlement'
+    _description = 'Règlement journalier Orange Money'
+    _order = 'date desc, id desc'
+
+    name = fields.Char(
+        string="Référence",
+        required=True,
+        readonly=True
+    )
+
+    date = fields.Date(
+        string="Date",
+        required=True,
+        index=True,
+        readonly=True
+    )
+
+    journal_id = fields.Many2one(
+        'account.journal',
+        string="Journal",
+        required=True,
+        readonly=True
+    )
+
+    company_id = fields.Many2one(
+        'res.company',
+        string="Société",
+        related='journal_id.company_id',
+        store=True
+    )
+
+    move_id = fields.Many2one(
+        'account.move',
+        string="Écriture de règlement",
+        readonly=True,
+        help="Écriture agrégée : une ligne de débit pour le total du jour, une ligne de crédit par facture"
+    )
+
+    transaction_ids = fields.One2many(
+        'orange.money.transaction',
+        'settlement_id',
+        string="Transactions"
+    )
+
+    transaction_count = fields.Integer(
+        string="Nombre de transactions",
+        readonly=True
+    )
+
+    amount_total = fields.Float(
+        string="Montant total",
+        digits=(16, 2),
+        readonly=True
+    )
+
+    state = fields.Selection([
+        ('draft', 'Brouillon'),
+        ('posted', 'Comptabilisé'),
+    ], string="État", default='draft', required=True, readonly=True)
+
+    def _get_outstanding_account(self, journal):
+        """Compte d'attente des encaissements : c'est lui qui sera lettré avec le relevé Orange."""
+        method_line = journal.inbound_payment_method_line_ids[:1]
+        account = method_line.payment_account_id or journal.company_id.account_journal_payment_debit_account_id
+        return account or journal.default_account_id
+
+    @api.model
+    def _settle_transactions(self, transactions, journal):
+        """
+        Comptabilise une écriture agrégée par jour pour les transactions SUCCESS
+        non encore réglées, puis lettre chaque ligne de crédit avec la facture.
+        """
+        Transaction = self.env['orange.money.transaction']
+        transactions = transactions._get_payable_transactions().filtered(lambda t: not t.settlement_id)
+        if not transactions:
+            return self.browse()
+
+        account = self._get_outstanding_account(journal)
+        if not account:
+            raise ValidationError(
+                f"Aucun compte d'encaissement configuré sur le journal {journal.display_name}."
+            )
+
+        by_date = defaultdict(lambda: Transaction)
+        for record in transactions:
+            completed_at = record.completed_at or fields.Datetime.now()
+            by_date[fields.Date.context_today(record, completed_at)] |= record
+
+        # Une seule recherche des lignes clients pour toutes les factures concernées
+        receivable_domain = Transaction._get_receivable_line_domain()
+        invoice_lines = self.env['account.move.line'].search(
+            [('move_id', 'in', transactions.mapped('account_move_id').ids), ('reconciled', '=', False)]
+            + receivable_domain
+        )
+        lines_by_invoice = defaultdict(lambda: self.env['account.move.line'])
+        for line in invoice_lines:
+            lines_by_invoice[line.move_id] |= line
+
+        settlements = self.browse()
+        for date, day_transactions in sorted(by_date.items()):
+            try:
+                with self.env.cr.savepoint():
+                    settlements |= self._create_settlement(
+                        date, journal, account, day_transactions, lines_by_invoice
+                    )
+            except Exception as e:
+                _logger.error("Erreur lors du règlement Orange Money du %s: %s", date, str(e))
+        return settlements
+
+    def _create_settlement(self, date, journal, account, transactions, lines_by_invoice):
+        amounts_by_invoice = defaultdict(float)
+        for record in transactions:
+            amounts_by_invoice[record.account_move_id] += record.amount
+
+        name = f"OM/{date.strftime('%Y%m%d')}/{journal.code}"
+        total = sum(amounts_by_invoice.values())
+
+        line_vals = [(0, 0, {
+            'name': f"Orange Money - encaissements du {date.strftime('%d/%m/%Y')}",
+            'account_id': account.id,
+            'debit': total,
+            'credit': 0.0,
+        })]
+        # Ordre des lignes de crédit = ordre de création : sert à les rattacher à leur facture
+        credit_invoices = list(amounts_by_invoice)
+        for invoice, amount in amounts_by_invoice.items():
+            receivable = lines_by_invoice.get(invoice)
+            line_vals.append((0, 0, {
+                'name': f"Orange Money - {invoice.name}",
+                'account_id': receivable[:1].account_id.id if receivable else invoice.partner_id.property_account_receivable_id.id,
+                'partner_id': invoice.partner_id.commercial_partner_id.id,
+                'debit': 0.0,
+                'credit': amount,
+            }))
+
+        move = self.env['account.move'].create({
+            'move_type': 'entry',
+            'journal_id': journal.id,
+            'date': date,
+            'ref': name,
+            'line_ids': line_vals,
+        })
+        move.action_post()
+
+        settlement = self.create({
+            'name': name,
+            'date': date,
+            'journal_id': journal.id,
+            'move_id': move.id,
+            'transaction_count': len(transactions),
+            'amount_total': total,
+            'state': 'posted',
+        })
+        transactions.write({'settlement_id': settlement.id})
+
+        # Lettrage ligne de crédit <-> lignes clients de la facture, par identifiant de ligne
+        # (les libellés peuvent se répéter, être traduits ou tronqués)
+        credit_lines = move.line_ids.filtered(lambda line: line.credit).sorted('id')
+        if len(credit_lines) != len(credit_invoices):
+            raise ValidationError(
+                f"Écriture {name} : {len(credit_lines)} ligne(s) de crédit pour {len(credit_invoices)} facture(s)."
+            )
+        credit_line_by_invoice = dict(zip(credit_invoices, credit_lines))
+        for invoice, credit_line in credit_line_by_invoice.items():
+            receivable = lines_by_invoice.get(invoice)
+            if not receivable or invoice.state != 'posted':
+                continue
+            if credit_line.account_id != receivable[:1].account_id:
+                continue
+            group = receivable | credit_line
+            try:
+                with self.env.cr.savepoint():
+                    group.reconcile()
+            except Exception as e:
+                _logger.error("Erreur lors du lettrage de la facture %s: %s", invoice.name, str(e))
+
+        _logger.info(
+            "Règlement Orange Money %s comptabilisé: %s transaction(s), %s",
+            name, len(transactions), total
+        )
+        return settlement
+
+    @api.model
+    def _cron_post_daily_settlements(self):
+        """Règle en une écriture par jour les transactions SUCCESS des journées terminées."""
+        config = self.env['orange.money.config'].search([('is_active', '=', True)], limit=1)
+        if not config or config.settlement_mode != 'daily':
+            return
+        journal = config._get_settlement_journal()
+        if not journal:
+            _logger.error("Aucun journal de règlement Orange Money configuré.")
+            return
+
+        today_start = fields.Datetime.to_datetime(fields.Date.context_today(self))
+        transactions = self.env['orange.money.transaction'].search([
+            ('status', '=', 'SUCCESS'),
+            ('payment_id', '=', False),
+            ('settlement_id', '=', False),
+            ('account_move_id', '!=', False),
+            ('completed_at', '<', today_start),
+        ], order='completed_at asc, id asc')
+        self._settle_transactions(transactions, journal)
+
+    def action_view_move(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': 'Écriture de règlement',
+            'res_model': 'account.move',
+            'res_id': self.move_id.id,
+            'view_mode': 'form',
+            'target': 'current',
+        }
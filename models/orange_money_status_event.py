@@ -0,0 +1,81 @@
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class OrangeMoneyStatusEvent(models.Model):
+    """
+    Journal compact (ajout seul) des changements de statut des transactions.
+    Sert de piste d'audit sans passer par mail.message, et de source d'analyse.
+    """
+    _name = 'orange.money.status.event'
+    _description = 'Changement de statut Orange Money'
+    _order = 'event_at desc, id desc'
+    _log_access = False
+
+    transaction_id = fields.Many2one(
+        'orange.money.transaction',
+        string="Transaction",
+        index=True,
+        ondelete='set null',
+        readonly=True
+    )
+
+    transaction_ref = fields.Char(
+        string="ID de transaction",
+        readonly=True,
+        help="Identifiant métier, conservé si la transaction est archivée"
+    )
+
+    event_at = fields.Datetime(
+        string="Date",
+        required=True,
+        default=fields.Datetime.now,
+        readonly=True
+    )
+
+    from_status = fields.Char(
+        string="Ancien statut",
+        readonly=True
+    )
+
+    to_status = fields.Char(
+        string="Nouveau statut",
+        required=True,
+        readonly=True
+    )
+
+    source = fields.Selection([
+        ('webhook', 'Webhook'),
+        ('poll', 'Interrogation portail'),
+        ('backoffice', 'Backoffice'),
+        ('cron', 'Tâche planifiée'),
+        ('api', 'API'),
+        ('system', 'Système'),
+    ], string="Source", default='system', required=True, readonly=True)
+
+    def init(self):
+        # Index BRIN : la table est alimentée dans l'ordre chronologique
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS orange_money_status_event_event_at_brin
+                ON orange_money_status_event USING brin (event_at)
+        """)
+
+    def write(self, vals):
+        raise UserError("Le journal des statuts Orange Money est en ajout seul.")
+
+    @api.model
+    def _log_transitions(self, transactions, to_status, source, from_statuses=None):
+        """Insérer en une fois les événements d'un lot de transactions."""
+        now = fields.Datetime.now()
+        from_statuses = from_statuses or {}
+        return self.sudo().create([{
+            'transaction_id': transaction.id,
+            'transaction_ref': transaction.transaction_id,
+            'event_at': now,
+            'from_status': from_statuses.get(transaction.id, transaction.status),
+            'to_status': to_status or transaction.status,
+            'source': source,
+        } for transaction in transactions])
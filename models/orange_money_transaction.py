@@ -1089,15 +1089,115 @@
 #                 }
 #             }
    
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
 import json
 from odoo.exceptions import ValidationError
+from odoo.osv import expression
+from odoo.tools.sql import column_exists, column_type, table_exists
 import logging
 import base64
-from datetime import datetime
+import psycopg2
+from collections import defaultdict
+from datetime import datetime, timedelta
+import re
 
 _logger = logging.getLogger(__name__)
 
+# Ordre des statuts : une transaction ne peut qu'avancer dans ce classement.
+STATUS_RANK = {
+    'PRE_INITIATED': 0,
+    'INITIATED': 1,
+    'PENDING': 2,
+    'ACCEPTED': 3,
+    'SUCCESS': 4,
+    'FAILED': 4,
+    'CANCELLED': 4,
+    'REJECTED': 4,
+}
+
+TERMINAL_STATUSES = ('SUCCESS', 'FAILED', 'CANCELLED', 'REJECTED')
+OPEN_STATUSES = ('PRE_INITIATED', 'INITIATED', 'PENDING', 'ACCEPTED')
+# Statuts ouverts portant un QR (valid_until renseigné) ; PRE_INITIATED n'est qu'une réservation
+QR_OPEN_STATUSES = ('INITIATED', 'PENDING', 'ACCEPTED')
+
+# Numéros nationaux (9 chiffres) rattachés à l'indicatif du Sénégal
+MSISDN_COUNTRY_CODE = '221'
+MSISDN_NATIONAL_LENGTH = 9
+_MSISDN_INTERNATIONAL_PREFIX = re.compile(r'^\s*(\+|00)')
+
+
+def normalize_msisdn(value):
+    """
+    Numéro -> E.164 (« +221784537547 »), ou False s'il n'est pas reconnu.
+    Accepte « +221 78 453 75 47 », « 0022178... », « 221784537547 » et « 784537547 ».
+    Doit rester aligné sur _NORMALIZE_MSISDN_SQL (rattrapage des colonnes en SQL).
+    """
+    if not value:
+        return False
+    value = str(value)
+    international = bool(_MSISDN_INTERNATIONAL_PREFIX.match(value))
+    digits = re.sub(r'\D', '', _MSISDN_INTERNATIONAL_PREFIX.sub('', value))
+    if international:
+        return f'+{digits}' if 8 <= len(digits) <= 15 else False
+    if len(digits) == MSISDN_NATIONAL_LENGTH:
+        return f'+{MSISDN_COUNTRY_CODE}{digits}'
+    if len(digits) == len(MSISDN_COUNTRY_CODE) + MSISDN_NATIONAL_LENGTH and digits.startswith(MSISDN_COUNTRY_CODE):
+        return f'+{digits}'
+    return False
+
+
+# Équivalent SQL de normalize_msisdn(), pour un rattrapage ensembliste ({value} : expression texte)
+_NORMALIZE_MSISDN_SQL = """
+    CASE
+        WHEN {value} ~ '^\\s*(\\+|00)' THEN
+            CASE WHEN length(regexp_replace(regexp_replace({value}, '^\\s*(\\+|00)', ''), '\\D', '', 'g')) BETWEEN 8 AND 15
+                 THEN '+' || regexp_replace(regexp_replace({value}, '^\\s*(\\+|00)', ''), '\\D', '', 'g')
+            END
+        WHEN length(regexp_replace({value}, '\\D', '', 'g')) = %(national_length)s THEN
+            '+' || %(country_code)s || regexp_replace({value}, '\\D', '', 'g')
+        WHEN length(regexp_replace({value}, '\\D', '', 'g')) = %(full_length)s
+         AND regexp_replace({value}, '\\D', '', 'g') LIKE %(country_code)s || '%%' THEN
+            '+' || regexp_replace({value}, '\\D', '', 'g')
+    END
+"""
+
+
+def backfill_msisdn_column(cr, table, column, source_sql):
+    """
+    Créer et remplir en un UPDATE la colonne E.164 avant que l'ORM ne la découvre :
+    sinon le champ calculé stocké serait recalculé enregistrement par enregistrement.
+    """
+    if not table_exists(cr, table) or column_exists(cr, table, column):
+        return
+    cr.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}" varchar')
+    cr.execute(
+        f'UPDATE "{table}" SET "{column}" = ' + _NORMALIZE_MSISDN_SQL.format(value=f'({source_sql})')
+        + f' WHERE ({source_sql}) IS NOT NULL',
+        {
+            'country_code': MSISDN_COUNTRY_CODE,
+            'national_length': MSISDN_NATIONAL_LENGTH,
+            'full_length': len(MSISDN_COUNTRY_CODE) + MSISDN_NATIONAL_LENGTH,
+        },
+    )
+    _logger.info("Colonne %s.%s initialisée pour %s ligne(s)", table, column, cr.rowcount)
+
+
+def msisdn_search_domain(field_name, operator, value):
+    """
+    Domaine de recherche sur une colonne E.164 : un numéro complet est cherché à l'égalité
+    (index btree), un fragment sur ses chiffres (index trigramme).
+    """
+    if not value or not isinstance(value, str):
+        return [(field_name, operator, value)]
+    positive = operator not in ('!=', 'not ilike', 'not like', 'not in')
+    normalized = normalize_msisdn(value)
+    if normalized:
+        return [(field_name, '=' if positive else '!=', normalized)]
+    digits = re.sub(r'\D', '', value)
+    if not digits:
+        return [(field_name, operator, value)]
+    return [(field_name, 'like' if positive else 'not like', digits)]
+
 
 class OrangeMoneyTransaction(models.Model):
     _name = 'orange.money.transaction'
@@ -1164,6 +1264,22 @@ class OrangeMoneyTransaction(models.Model):
         help="Numéro de téléphone du client (format: 771234567)"
     )
 
+    # Numéro normalisé : égalité via btree (init()), fragments via l'index trigramme
+    customer_msisdn_e164 = fields.Char(
+        string="MSISDN Client (E.164)",
+        compute='_compute_customer_msisdn_e164',
+        store=True,
+        index='trigram',
+        help="Numéro du client au format E.164 (+221...), issu du MSISDN saisi ou de l'identifiant client du webhook"
+    )
+
+    msisdn_search = fields.Char(
+        string="Téléphone",
+        compute='_compute_msisdn_search',
+        search='_search_msisdn',
+        help="Recherche par numéro, quel que soit son format (+221, 00221, espaces, 9 chiffres)"
+    )
+
     # Marchand
     merchant_code = fields.Char(
         string="Code Marchand",
@@ -1262,12 +1378,37 @@ class OrangeMoneyTransaction(models.Model):
         help="Date de fin de validité"
     )
 
-    # Métadonnées brutes
-    metadata = fields.Text(
+    # Métadonnées brutes (jsonb)
+    metadata = fields.Json(
         string="Métadonnées",
         help="Métadonnées JSON"
     )
 
+    metadata_text = fields.Text(
+        string="Métadonnées (JSON)",
+        compute='_compute_json_texts'
+    )
+
+    # Recherche dans les métadonnées, servie par les index de init()
+    metadata_order_id = fields.Char(
+        string="Commande (métadonnées)",
+        compute='_compute_metadata_keys',
+        search='_search_metadata_order_id'
+    )
+
+    metadata_reference = fields.Char(
+        string="Référence (métadonnées)",
+        compute='_compute_metadata_keys',
+        search='_search_metadata_reference'
+    )
+
+    metadata_search = fields.Char(
+        string="Métadonnées contiennent",
+        compute='_compute_metadata_keys',
+        search='_search_metadata',
+        help="« clé:valeur » pour une égalité exacte sur une clé (index GIN), sinon recherche dans le texte"
+    )
+
     # ============================
     # FACTURE / PDF
     # ============================
@@ -1303,17 +1444,27 @@ class OrangeMoneyTransaction(models.Model):
         help="Permet d'envoyer l'email avec la facture une seule fois"
     )
 
-    # Réponses API / webhook
-    orange_response = fields.Text(
+    # Réponses API / webhook (jsonb)
+    orange_response = fields.Json(
         string="Réponse Orange Money",
         help="Réponse complète de l'API Orange Money"
     )
 
-    webhook_data = fields.Text(
+    webhook_data = fields.Json(
         string="Données Webhook",
         help="Dernières données reçues via webhook"
     )
 
+    orange_response_text = fields.Text(
+        string="Réponse Orange Money (JSON)",
+        compute='_compute_json_texts'
+    )
+
+    webhook_data_text = fields.Text(
+        string="Données Webhook (JSON)",
+        compute='_compute_json_texts'
+    )
+
     # Relations Odoo
     account_move_id = fields.Many2one(
         'account.move',
@@ -1329,6 +1480,24 @@ class OrangeMoneyTransaction(models.Model):
         tracking=True
     )
 
+    payment_id = fields.Many2one(
+        'account.payment',
+        string="Paiement",
+        readonly=True,
+        copy=False,
+        index=True,
+        help="Paiement comptable créé pour cette transaction"
+    )
+
+    settlement_id = fields.Many2one(
+        'orange.money.settlement',
+        string="Règlement journalier",
+        readonly=True,
+        copy=False,
+        index=True,
+        help="Écriture agrégée du jour qui solde cette transaction (mode règlement journalier)"
+    )
+
     # Dates
     created_at = fields.Datetime(
         string="Date de création",
@@ -1343,6 +1512,12 @@ class OrangeMoneyTransaction(models.Model):
         readonly=True
     )
 
+    status_event_ids = fields.One2many(
+        'orange.money.status.event',
+        'transaction_id',
+        string="Historique des statuts"
+    )
+
     completed_at = fields.Datetime(
         string="Date de completion",
         readonly=True,
@@ -1350,6 +1525,14 @@ class OrangeMoneyTransaction(models.Model):
         tracking=True
     )
 
+    success_stage = fields.Selection([
+        ('completed', 'Complétée'),
+        ('invoice', 'Facture PDF générée'),
+        ('payment', 'Paiement comptabilisé'),
+        ('done', 'Client notifié'),
+    ], string="Étape post-paiement", readonly=True, copy=False, index=True,
+        help="Dernière étape terminée du traitement d'une transaction réussie")
+
     # Champs calculés visuels
     status_color = fields.Integer(
         string="Couleur du statut",
@@ -1456,81 +1639,324 @@ class OrangeMoneyTransaction(models.Model):
         for record in self:
             record.has_qr_code = bool(record.qr_code_base64 or record.qr_code_url or record.deep_link)
 
+    @api.depends('customer_msisdn', 'customer_id', 'customer_id_type')
+    def _compute_customer_msisdn_e164(self):
+        """Doit rester aligné sur la source SQL de _auto_init()."""
+        for record in self:
+            msisdn = record.customer_msisdn
+            if not msisdn and (record.customer_id_type or '').upper() == 'MSISDN':
+                msisdn = record.customer_id
+            record.customer_msisdn_e164 = normalize_msisdn(msisdn)
+
+    def _compute_msisdn_search(self):
+        for record in self:
+            record.msisdn_search = record.customer_msisdn_e164
+
+    def _search_msisdn(self, operator, value):
+        return msisdn_search_domain('customer_msisdn_e164', operator, value)
+
+    @api.depends('metadata', 'orange_response', 'webhook_data')
+    def _compute_json_texts(self):
+        """Affichage lisible des colonnes jsonb dans le formulaire."""
+        def dump(value):
+            return json.dumps(value, indent=2, ensure_ascii=False) if value else False
+
+        for record in self:
+            record.metadata_text = dump(record.metadata)
+            record.orange_response_text = dump(record.orange_response)
+            record.webhook_data_text = dump(record.webhook_data)
+
+    @api.depends('metadata')
+    def _compute_metadata_keys(self):
+        for record in self:
+            metadata = record.metadata if isinstance(record.metadata, dict) else {}
+            record.metadata_order_id = metadata.get('order_id')
+            record.metadata_reference = metadata.get('reference')
+            record.metadata_search = False
+
+    # Opérateurs de domaine -> opérateurs SQL sur metadata->>clé
+    _METADATA_SQL_OPERATORS = {
+        '=': '=', 'like': 'LIKE', 'ilike': 'ILIKE', '=like': 'LIKE', '=ilike': 'ILIKE',
+    }
+    # Opérateurs négatifs : complément de l'opérateur positif, qui inclut donc les lignes
+    # sans la clé (comme != sur un champ Odoo, qui inclut NULL)
+    _METADATA_NEGATIVE_OPERATORS = {
+        '!=': '=', 'not like': 'like', 'not ilike': 'ilike', 'not in': 'in',
+    }
+
+    def _search_metadata_key(self, key, operator, value):
+        """Domaine sur metadata->>key ; '=' et 'in' utilisent l'index d'expression."""
+        if operator in self._METADATA_NEGATIVE_OPERATORS:
+            domain = self._search_metadata_key(key, self._METADATA_NEGATIVE_OPERATORS[operator], value)
+            if domain == expression.FALSE_DOMAIN:
+                return expression.TRUE_DOMAIN
+            [(_field, _operator, query)] = domain
+            return [('id', 'not inselect', query)]
+        if operator == '=' and value is False:
+            sql = "SELECT id FROM orange_money_transaction WHERE metadata->>%s IS NULL"
+            return [('id', 'inselect', (sql, (key,)))]
+        if operator == 'in':
+            if not value:
+                return expression.FALSE_DOMAIN
+            sql = "SELECT id FROM orange_money_transaction WHERE metadata->>%s IN %s"
+            return [('id', 'inselect', (sql, (key, tuple(str(v) for v in value))))]
+        if operator not in self._METADATA_SQL_OPERATORS:
+            raise ValidationError(f"Opérateur non supporté pour les métadonnées : {operator}")
+        if operator in ('like', 'ilike'):
+            value = f"%{value}%"
+        sql = f"SELECT id FROM orange_money_transaction WHERE metadata->>%s {self._METADATA_SQL_OPERATORS[operator]} %s"
+        return [('id', 'inselect', (sql, (key, str(value))))]
+
+    def _search_metadata_order_id(self, operator, value):
+        return self._search_metadata_key('order_id', operator, value)
+
+    def _search_metadata_reference(self, operator, value):
+        return self._search_metadata_key('reference', operator, value)
+
+    def _search_metadata(self, operator, value):
+        """« clé:valeur » -> metadata @> {"clé": "valeur"} (index GIN) ; sinon texte du document."""
+        if not isinstance(value, str) or operator not in ('=', 'ilike', 'like'):
+            raise ValidationError(f"Opérateur non supporté pour les métadonnées : {operator}")
+        key, sep, key_value = value.partition(':')
+        if sep and key.strip():
+            sql = "SELECT id FROM orange_money_transaction WHERE metadata @> %s::jsonb"
+            return [('id', 'inselect', (sql, (json.dumps({key.strip(): key_value.strip()}),)))]
+        sql = "SELECT id FROM orange_money_transaction WHERE metadata::text ILIKE %s"
+        return [('id', 'inselect', (sql, (f"%{value}%",)))]
+
     # ============================
     # OVERRIDE WRITE : cœur logique
     # ============================
     def write(self, vals):
-        """On centralise ici : completed_at + PDF + paiement + mail."""
-        if 'status' in vals:
-            _logger.info(
-                "Changement de statut de la transaction %s: %s -> %s",
-                self.ids, self.mapped('status'), vals.get('status')
-            )
+        """
+        On centralise ici : completed_at + PDF + paiement + mail.
+        Retourne False si la transition de statut est refusée pour au moins une ligne
+        (les autres valeurs sont tout de même écrites).
+        """
+        records = self
+        changing = self.browse()
+        refused = self.browse()
+        if not self._INVOICE_STATS_FIELDS.isdisjoint(vals):
+            # Recalcul différé au commit : l'ancienne et la nouvelle facture sont relues en SQL
+            self.account_move_id._schedule_orange_money_stats()
+            if vals.get('account_move_id'):
+                self.env['account.move'].browse(vals['account_move_id'])._schedule_orange_money_stats()
+
+        if 'status' in vals and self:
+            # Webhook, poll portail et bouton backoffice peuvent écrire la même ligne en même temps :
+            # on la verrouille et on relit le statut avant de décider de la transition.
+            if not self.env.context.get('om_rows_locked'):
+                self._lock_rows(nowait=False)
+
+            refused = self.filtered(lambda r: not r._is_status_transition_allowed(vals['status']))
+            if refused:
+                _logger.warning(
+                    "Transition de statut refusée pour les transactions %s: %s -> %s",
+                    refused.ids, refused.mapped('status'), vals['status']
+                )
+                other_vals = {key: value for key, value in vals.items() if key != 'status'}
+                if other_vals:
+                    super(OrangeMoneyTransaction, refused).write(other_vals)
+                records = self - refused
+                if not records:
+                    return False
+
+            changing = records.filtered(lambda r: r.status != vals['status'])
+            if vals['status'] == 'SUCCESS' and any(record._is_local_expiry() for record in changing):
+                _logger.warning(
+                    "Paiement reçu après expiration locale, transactions rouvertes : %s",
+                    changing.filtered(lambda r: r._is_local_expiry()).ids
+                )
+                vals.setdefault('status_reason', False)
+            if changing:
+                _logger.info(
+                    "Changement de statut de la transaction %s: %s -> %s",
+                    changing.ids, changing.mapped('status'), vals['status']
+                )
+                self.env['orange.money.status.event']._log_transitions(
+                    changing, vals['status'], self._get_status_source()
+                )
             vals.setdefault('updated_at', fields.Datetime.now())
+            if not self._is_chatter_enabled():
+                records = records.with_context(tracking_disable=True)
+
+        res = super(OrangeMoneyTransaction, records).write(vals)
 
-        res = super(OrangeMoneyTransaction, self).write(vals)
+        if changing:
+            changing._notify_status_bus()
 
         if 'status' in vals:
-            for record in self:
-                # On ne déclenche qu'au premier passage en SUCCESS
-                if record.status == 'SUCCESS' and not record.completed_at:
-                    record.completed_at = fields.Datetime.now()
-
-                    # 1) Génération du PDF
-                    try:
-                        record._generate_invoice_pdf()
-                        _logger.info(
-                            "Facture générée avec succès pour la transaction %s",
-                            record.transaction_id
-                        )
-                    except Exception as e:
-                        _logger.error(
-                            "Erreur lors de la génération de la facture pour la transaction %s: %s",
-                            record.transaction_id, str(e)
-                        )
+            # Pipeline SUCCESS en étapes idempotentes (reprises par le cron en cas d'échec)
+            records.filtered(
+                lambda r: r.status == 'SUCCESS' and r.success_stage != 'done'
+            )._run_success_pipeline()
 
-                    # 2) Création paiement + réconciliation + mail
-                    try:
-                        record._create_payment_and_link_invoice()
-                    except Exception as e:
-                        _logger.error(
-                            "Erreur lors de la création du paiement pour la transaction %s: %s",
-                            record.transaction_id, str(e)
-                        )
+        return res and not refused
 
-                    # 3) Message chatter
-                    record.message_post(
-                        body=f"Transaction complétée avec succès. Montant: {record.formatted_amount}",
-                        message_type='notification'
-                    )
+    # ============================
+    # VERROUILLAGE / TRANSITIONS
+    # ============================
+    # Champs dont dépendent les totaux Orange Money stockés sur account.move
+    _INVOICE_STATS_FIELDS = frozenset(('status', 'amount', 'account_move_id'))
 
-        return res
+    def _lock_rows(self, nowait=True):
+        """
+        Verrouiller les lignes (SELECT ... FOR UPDATE [NOWAIT]) jusqu'à la fin de la
+        transaction SQL, puis relire l'état depuis la base.
+        Retourne False si une ligne est déjà verrouillée (mode NOWAIT).
+        """
+        if not self.ids:
+            return True
+        query = f"SELECT id FROM {self._table} WHERE id IN %s ORDER BY id FOR UPDATE"
+        if nowait:
+            query += " NOWAIT"
+        try:
+            with self.env.cr.savepoint(flush=False):
+                self.env.cr.execute(query, (tuple(self.ids),))
+        except psycopg2.errors.LockNotAvailable:
+            return False
+        self.invalidate_recordset(['status', 'status_reason', 'completed_at', 'payment_id', 'invoice_sent'])
+        return True
+
+    @api.model
+    def _get_status_bus_channel(self, transaction_id):
+        """Canal bus.bus d'une transaction, écouté par le SSE / long-poll du portail."""
+        return f'orange_money_tx_{transaction_id}'
+
+    def _notify_status_bus(self):
+        """Pousser le nouveau statut sur bus.bus ; envoyé au commit, rien si la transaction SQL est annulée."""
+        self.env['bus.bus']._sendmany([
+            (self._get_status_bus_channel(record.transaction_id), 'orange_money/status', {
+                'transaction_id': record.transaction_id,
+                'status': record.status,
+            })
+            for record in self
+        ])
+
+    @api.model
+    def _get_status_source(self):
+        """Origine du changement de statut (webhook, poll, backoffice...), passée par le contexte."""
+        return self.env.context.get('om_status_source', 'system')
+
+    @api.model
+    def _is_chatter_enabled(self):
+        """Les transitions manuelles vont toujours au chatter ; les automatiques selon la config."""
+        if self._get_status_source() == 'backoffice':
+            return True
+        return self._chatter_on_automated_transitions()
+
+    @api.model
+    @tools.ormcache()
+    def _chatter_on_automated_transitions(self):
+        config = self.env['orange.money.config'].sudo().search([('is_active', '=', True)], limit=1)
+        return not config or config.chatter_on_automated_transitions
+
+    def _is_status_transition_allowed(self, new_status):
+        """
+        Transitions monotones : pas de retour arrière, pas de sortie d'un statut final,
+        sauf une expiration locale démentie par un SUCCESS d'Orange (paiement de dernière seconde).
+        """
+        self.ensure_one()
+        if new_status == self.status:
+            return True
+        if self.status in TERMINAL_STATUSES:
+            # Une expiration locale n'est qu'une supposition : le SUCCESS d'Orange l'emporte
+            return self._is_local_expiry() and new_status == 'SUCCESS'
+        return STATUS_RANK.get(new_status, 0) > STATUS_RANK.get(self.status, 0)
+
+    def _is_local_expiry(self):
+        """Échec posé par le cron d'expiration, sans confirmation d'Orange."""
+        self.ensure_one()
+        return self.status == 'FAILED' and self.status_reason == 'EXPIRED'
+
+    def _set_status(self, status, vals=None, nowait=True):
+        """
+        Changement de statut sous verrou de ligne.
+        En mode NOWAIT (polls portail / backoffice), si un autre processus traite déjà
+        la transaction on n'attend pas : retourne False et la lecture suivante verra son résultat.
+        Retourne aussi False si la transition est refusée (statut final déjà atteint) ;
+        le statut relu sous verrou permet alors de distinguer les deux cas.
+        """
+        self.ensure_one()
+        vals = dict(vals or {}, status=status)
+        # Poll ou webhook redélivré sans changement : une lecture, ni verrou ni UPDATE
+        if not self._get_changed_vals(vals):
+            return True
+        if not self._lock_rows(nowait=nowait):
+            _logger.info(
+                "Transaction %s en cours de mise à jour par un autre processus, écriture ignorée",
+                self.transaction_id
+            )
+            return False
+        # Relecture sous verrou : un autre processus a pu appliquer la transition entre-temps
+        changed = self._get_changed_vals(vals)
+        if not changed:
+            return True
+        return self.with_context(om_rows_locked=True).write(changed)
+
+    # Champs de suivi mis à jour à chaque écriture : ils ne suffisent pas à justifier un UPDATE
+    _DIFF_IGNORED_FIELDS = ('updated_at',)
+
+    def _get_changed_vals(self, vals):
+        """Ne garder de vals que les valeurs qui diffèrent de l'enregistrement."""
+        self.ensure_one()
+        changed = {}
+        for name, value in vals.items():
+            if name in self._DIFF_IGNORED_FIELDS:
+                continue
+            field = self._fields[name]
+            if field.type in ('one2many', 'many2many'):
+                changed[name] = value
+                continue
+            new_value = field.convert_to_record(field.convert_to_cache(value, self), self)
+            # '' / False / None sont équivalents en base
+            if (new_value or False) != (self[name] or False):
+                changed[name] = value
+        if changed:
+            changed.update({name: vals[name] for name in self._DIFF_IGNORED_FIELDS if name in vals})
+        return changed
 
     # ============================
     # CREATE
     # ============================
-    @api.model
-    def create(self, vals):
-        """Validation + merchant_code auto comme pour Wave."""
-        if vals.get('transaction_id'):
-            existing = self.search([('transaction_id', '=', vals['transaction_id'])])
-            if existing:
-                raise ValidationError(
-                    f"Une transaction avec l'ID '{vals['transaction_id']}' existe déjà."
-                )
+    @api.model_create_multi
+    def create(self, vals_list):
+        """
+        Création en lot : merchant_code auto avec une seule recherche de config par lot.
+        L'unicité de transaction_id est garantie par la contrainte transaction_id_unique.
+        Passer mail_create_nolog=True dans le contexte pour ne pas poster de message
+        (imports, initiations en masse).
+        """
+        if not self._is_chatter_enabled():
+            self = self.with_context(mail_create_nolog=True, tracking_disable=True)
 
-        config = self.env['orange.money.config'].sudo().search([('is_active', '=', True)], limit=1)
-        if config and not vals.get('merchant_code'):
-            vals['merchant_code'] = config.merchant_code
+        if any(not vals.get('merchant_code') for vals in vals_list):
+            config = self.env['orange.money.config'].sudo().search([('is_active', '=', True)], limit=1)
+            if config:
+                for vals in vals_list:
+                    if not vals.get('merchant_code'):
+                        vals['merchant_code'] = config.merchant_code
 
-        record = super().create(vals)
+        records = super().create(vals_list)
+        records.account_move_id._schedule_orange_money_stats()
 
-        record.message_post(
-            body=f"Transaction Orange Money créée pour un montant de {record.formatted_amount}",
-            message_type='notification'
+        self.env['orange.money.status.event']._log_transitions(
+            records, False, self._get_status_source(),
+            from_statuses=dict.fromkeys(records.ids, False)
         )
 
-        return record
+        if not self.env.context.get('mail_create_nolog'):
+            for record in records:
+                record.message_post(
+                    body=f"Transaction Orange Money créée pour un montant de {record.formatted_amount}",
+                    message_type='notification'
+                )
+
+        return records
+
+    def unlink(self):
+        self.account_move_id._schedule_orange_money_stats()
+        return super().unlink()
 
     # ============================
     # ACTIONS UI
@@ -1547,20 +1973,40 @@ class OrangeMoneyTransaction(models.Model):
             if not transaction_id:
                 raise ValidationError("L'ID de transaction est requis pour vérifier le statut.")
 
-            status_data = config.get_transaction_status(transaction_id)
+            status_data = config.with_context(om_status_source='backoffice').get_transaction_status(transaction_id)
             if status_data:
                 status = (status_data.get('status') or '').upper()
                 old_status = self.status
 
                 vals = {
-                    'orange_response': json.dumps(status_data),
+                    'orange_response': status_data,
                     'status_reason': status_data.get('statusReason', ''),
                 }
                 if status:
                     vals['status'] = status
 
                 if status and status != old_status:
-                    self.write(vals)
+                    new_status = vals.pop('status')
+                    if not self.with_context(om_status_source='backoffice')._set_status(new_status, vals):
+                        if not self._is_status_transition_allowed(new_status):
+                            return {
+                                'type': 'ir.actions.client',
+                                'tag': 'display_notification',
+                                'params': {
+                                    'title': 'Transition refusée',
+                                    'message': f'Statut {self.status} final : le statut {new_status} renvoyé par Orange est ignoré.',
+                                    'type': 'danger',
+                                }
+                            }
+                        return {
+                            'type': 'ir.actions.client',
+                            'tag': 'display_notification',
+                            'params': {
+                                'title': 'Transaction occupée',
+                                'message': 'La transaction est en cours de mise à jour, réessayez dans un instant.',
+                                'type': 'warning',
+                            }
+                        }
                     return {
                         'type': 'ir.actions.client',
                         'tag': 'display_notification',
@@ -1748,11 +2194,69 @@ class OrangeMoneyTransaction(models.Model):
                 }
             }
 
+    # ============================
+    # FICHIERS PUBLICS : QR + REÇU
+    # ============================
+    @api.model
+    def _get_public_base_url(self):
+        return self.env['ir.config_parameter'].sudo().get_param('web.base.url')
+
+    @api.model
+    def _build_qr_image_url(self, transaction_id, qr_id, base_url=None):
+        """URL versionnée par le qrId : son contenu ne change jamais, elle peut être mise en cache."""
+        if not transaction_id or not qr_id:
+            return None
+        base_url = base_url if base_url is not None else self._get_public_base_url()
+        return f"{base_url}/api/payment/orange/qr/{transaction_id}?v={qr_id}"
+
+    @api.model
+    def _build_receipt_url(self, transaction_id, generated_at, base_url=None):
+        """URL versionnée par la date de génération du PDF (une régénération change l'URL)."""
+        if not transaction_id or not generated_at:
+            return None
+        base_url = base_url if base_url is not None else self._get_public_base_url()
+        return f"{base_url}/api/payment/orange/receipt/{transaction_id}?v={self._receipt_version(generated_at)}"
+
+    @api.model
+    def _receipt_version(self, generated_at):
+        return str(int(fields.Datetime.to_datetime(generated_at).timestamp()))
+
+    def _get_qr_image_url(self):
+        self.ensure_one()
+        return self._build_qr_image_url(self.transaction_id, self.qr_id)
+
+    def _get_receipt_url(self):
+        self.ensure_one()
+        return self._build_receipt_url(self.transaction_id, self.facture_generated_at)
+
+    def _get_qr_png(self):
+        """Octets PNG du QR code (le champ stocke du base64, éventuellement en data URI)."""
+        self.ensure_one()
+        if not self.qr_code_base64:
+            return None
+        data = self.qr_code_base64
+        if data.startswith('data:'):
+            data = data.split(',', 1)[-1]
+        try:
+            return base64.b64decode(data)
+        except (ValueError, TypeError):
+            _logger.error("QR code illisible pour la transaction %s", self.transaction_id)
+            return None
+
     # ============================
     # FACTURE : PDF + MAIL
     # ============================
     def _generate_invoice_pdf(self):
         """Construit et sauvegarde le PDF (ir.attachment + champs Binary)."""
+        vals = self._prepare_invoice_pdf_vals()
+        if not vals:
+            return False
+        self.write(vals)
+        return vals['url_facture']
+
+    def _prepare_invoice_pdf_vals(self):
+        """Construit le PDF et son ir.attachment ; retourne les valeurs à écrire sur la transaction."""
+        self.ensure_one()
         try:
             _logger.info(f"Génération de la facture PDF pour la transaction {self.transaction_id}")
 
@@ -1774,22 +2278,20 @@ class OrangeMoneyTransaction(models.Model):
 
                 base_url = self.env['ir.config_parameter'].sudo().get_param('web.base.url')
                 url_facture = f"{base_url}/web/content/{attachment.id}?download=true"
-
-                self.write({
+                _logger.info(f"Facture PDF générée avec succès: {url_facture}")
+                return {
                     'facture_pdf': pdf_base64,
                     'facture_filename': filename,
                     'url_facture': url_facture,
                     'facture_generated_at': fields.Datetime.now(),
                     'facture_size': len(pdf_content)
-                })
-                _logger.info(f"Facture PDF générée avec succès: {url_facture}")
-                return url_facture
+                }
             else:
                 _logger.error("Erreur lors de la génération du PDF")
-                return False
+                return {}
         except Exception as e:
             _logger.error(f"Erreur lors de la génération de la facture PDF: {str(e)}")
-            return False
+            return {}
 
     def _get_invoice_html_content(self):
         """Template HTML (comme ton code)."""
@@ -1932,7 +2434,10 @@ class OrangeMoneyTransaction(models.Model):
             return False
 
     def _auto_save_invoice_info(self):
-        """Log + envoi mail si pas encore envoyé."""
+        """
+        Log + envoi mail si pas encore envoyé ; retourne les valeurs à écrire,
+        ou False si l'envoi a échoué (le pipeline le retentera).
+        """
         self.ensure_one()
         try:
             _logger.info(f"Enregistrement automatique des informations pour la transaction {self.transaction_id}")
@@ -1953,11 +2458,12 @@ class OrangeMoneyTransaction(models.Model):
             }
             _logger.info(f"Facture générée et enregistrée: {json.dumps(invoice_log_data, default=str)}")
 
-            # Envoi mail une seule fois
-            if not self.invoice_sent:
-                if self._send_invoice_notification():
-                    self.sudo().write({'invoice_sent': True})
-            return True
+            # Envoi mail une seule fois, et seulement si le client a une adresse
+            if self.invoice_sent or not (self.partner_id and self.partner_id.email):
+                return {}
+            if self._send_invoice_notification():
+                return {'invoice_sent': True}
+            return False
         except Exception as e:
             _logger.error(f"Erreur lors de l'enregistrement automatique: {str(e)}")
             return False
@@ -2010,6 +2516,13 @@ class OrangeMoneyTransaction(models.Model):
                 mail_mail = self.env['mail.mail'].sudo().create(email_values)
                 try:
                     mail_mail.send()
+                    # send() ne lève pas : un échec SMTP laisse le mail en état « exception »
+                    if mail_mail.exists() and mail_mail.state == 'exception':
+                        _logger.error(
+                            "Échec de l'envoi de l'email de facture pour la transaction %s : %s",
+                            self.transaction_id, mail_mail.failure_reason
+                        )
+                        return False
                     _logger.info(f"Email de facture envoyé avec succès pour la transaction {self.transaction_id}")
                     return True
                 except Exception as e:
@@ -2021,113 +2534,413 @@ class OrangeMoneyTransaction(models.Model):
             return False
 
     # ============================
-    # PAIEMENT & RÉCONCILIATION
+    # PIPELINE SUCCESS
     # ============================
-    def _create_payment_and_link_invoice(self):
-        """Créer un paiement + réconcilier + envoyer mail (appelé uniquement au SUCCESS)."""
-        try:
-            _logger.info(f"Création du paiement pour la transaction Orange Money {self.transaction_id}")
+    def _flush_stage(self, vals):
+        """Une seule écriture par étape, sans repasser par la logique de statut de write()."""
+        return super(OrangeMoneyTransaction, self).write(vals)
 
-            if self.status != 'SUCCESS':
-                _logger.warning(
-                    "La transaction %s n'est pas en SUCCESS (statut actuel: %s). Aucun paiement créé.",
-                    self.transaction_id, self.status
-                )
-                return False
-
-            if not self.account_move_id:
-                _logger.error("Aucune facture liée à la transaction %s.", self.transaction_id)
-                return False
-
-            if not self.partner_id:
-                _logger.error("Aucun client lié à la transaction %s.", self.transaction_id)
-                return False
-
-            account_move = self.account_move_id
-            partner = self.partner_id
-            company = self.env.company
-
-            # Journal de paiement
-            journal = self.env['account.journal'].search([
-                ('type', 'in', ['bank', 'cash']),
-                ('company_id', '=', company.id)
-            ], limit=1)
-
-            if not journal:
-                _logger.error("Aucun journal de paiement (bank/cash) trouvé pour la compagnie.")
-                return False
-
-            payment_method = self.env['account.payment.method'].search([
-                ('payment_type', '=', 'inbound')
-            ], limit=1)
-
-            if not payment_method:
-                _logger.error("Aucune méthode de paiement trouvée.")
-                return False
-
-            payment = self.env['account.payment'].create({
-                'payment_type': 'inbound',
-                'partner_type': 'customer',
-                'partner_id': partner.id,
-                'amount': self.amount,
-                'journal_id': journal.id,
-                'currency_id': account_move.currency_id.id,
-                'payment_method_id': payment_method.id,
-                'ref': f"Paiement Orange Money - {self.reference}",
+    def _run_success_pipeline(self):
+        """
+        Traitement d'une transaction réussie, en étapes idempotentes :
+        completed -> invoice (PDF) -> payment -> done (mail + chatter).
+        Chaque étape persiste son état ; une étape interrompue est reprise par le cron.
+        """
+        records = self.filtered(lambda r: r.status == 'SUCCESS' and r.success_stage != 'done')
+        if not records:
+            return
+
+        # 1) Complétion : une écriture pour tout le lot
+        to_complete = records.filtered(lambda r: not r.success_stage)
+        if to_complete:
+            to_complete._flush_stage({
+                'completed_at': fields.Datetime.now(),
+                'success_stage': 'completed',
             })
 
-            payment.action_post()
-            self._reconcile_payment_with_invoice(payment, account_move)
+        # 2) PDF : une étape n'avance que si elle a réussi, le cron reprend les autres
+        for record in records.filtered(lambda r: r.success_stage == 'completed'):
+            vals = record._prepare_invoice_pdf_vals()
+            if not vals:
+                _logger.error(
+                    "Erreur lors de la génération de la facture pour la transaction %s, reprise par le cron",
+                    record.transaction_id
+                )
+                continue
+            vals['success_stage'] = 'invoice'
+            record._flush_stage(vals)
 
-            # Log + email (avec garde-fou invoice_sent)
-            try:
-                self._auto_save_invoice_info()
-            except Exception as e:
-                _logger.error(f"Erreur lors de l'enregistrement automatique / envoi du mail: {str(e)}")
+        # 3) Paiement : moteur en lot (ou écriture journalière)
+        to_pay = records.filtered(lambda r: r.success_stage == 'invoice')
+        if to_pay:
+            config = self.env['orange.money.config'].sudo().search([('is_active', '=', True)], limit=1)
+            if config.settlement_mode == 'daily':
+                # Le paiement sera porté par l'écriture de règlement du jour
+                paid = to_pay
+            else:
+                try:
+                    to_pay._create_payments_batch()
+                except Exception as e:
+                    _logger.error("Erreur lors de la création des paiements Orange Money: %s", str(e))
+                # Celles qui restent payables ont échoué : le cron les reprendra
+                paid = to_pay - to_pay._get_payable_transactions()
+            if paid:
+                paid._flush_stage({'success_stage': 'payment'})
+
+        # 4) Notification client + chatter
+        for record in records.filtered(lambda r: r.success_stage == 'payment'):
+            vals = record._auto_save_invoice_info()
+            if vals is False:
+                _logger.error(
+                    "Notification client non envoyée pour la transaction %s, reprise par le cron",
+                    record.transaction_id
+                )
+                continue
+            vals['success_stage'] = 'done'
+            record._flush_stage(vals)
+            if self._is_chatter_enabled():
+                record.message_post(
+                    body=f"Transaction complétée avec succès. Montant: {record.formatted_amount}",
+                    message_type='notification'
+                )
 
-            _logger.info(
-                "Paiement créé et réconcilié avec succès pour la transaction %s",
-                self.transaction_id
-            )
-            return True
-        except Exception as e:
-            _logger.error(f"Erreur lors de la création du paiement: {str(e)}")
-            return False
+    # Colonnes autrefois en text (json.dumps), désormais en jsonb
+    _JSONB_COLUMNS = ('metadata', 'orange_response', 'webhook_data')
+
+    def _auto_init(self):
+        """
+        Convertir en place les anciennes colonnes text en jsonb avant que l'ORM ne le fasse :
+        sa conversion (USING col::jsonb) échoue sur la première valeur invalide et mettrait
+        alors la colonne de côté. Les valeurs vides deviennent NULL, les textes non JSON
+        des chaînes JSON.
+        """
+        cr = self.env.cr
+        legacy = [
+            column for column in self._JSONB_COLUMNS
+            if column_exists(cr, self._table, column) and column_type(cr, self._table, column) == 'text'
+        ]
+        if legacy:
+            cr.execute("""
+                CREATE FUNCTION pg_temp.orange_money_to_jsonb(value text) RETURNS jsonb AS $$
+                BEGIN
+                    IF value IS NULL OR btrim(value) = '' THEN
+                        RETURN NULL;
+                    END IF;
+                    RETURN value::jsonb;
+                EXCEPTION WHEN others THEN
+                    RETURN to_jsonb(value);
+                END
+                $$ LANGUAGE plpgsql IMMUTABLE
+            """)
+            cr.execute("ALTER TABLE {} {}".format(
+                self._table,
+                ", ".join(
+                    f'ALTER COLUMN "{column}" TYPE jsonb USING pg_temp.orange_money_to_jsonb("{column}")'
+                    for column in legacy
+                ),
+            ))
+            cr.execute("DROP FUNCTION pg_temp.orange_money_to_jsonb(text)")
+            _logger.info("Colonnes Orange Money converties en jsonb : %s", ", ".join(legacy))
+        backfill_msisdn_column(
+            cr, self._table, 'customer_msisdn_e164',
+            "COALESCE(NULLIF(customer_msisdn, ''), "
+            "CASE WHEN upper(customer_id_type) = 'MSISDN' THEN customer_id END)",
+        )
+        # Étape post-paiement : rattrapage une seule fois, à la création de la colonne ; les lignes
+        # importées ensuite avec une étape vide passent par le pipeline (cron de reprise)
+        backfill_stage = table_exists(cr, self._table) and not column_exists(cr, self._table, 'success_stage')
+        res = super()._auto_init()
+        if backfill_stage:
+            self.pool.post_init(self._backfill_success_stage)
+        return res
+
+    def _backfill_success_stage(self):
+        # Transactions réussies antérieures au pipeline : déjà traitées par l'ancien write()
+        self.env.cr.execute("""
+            UPDATE orange_money_transaction
+               SET success_stage = 'done'
+             WHERE status = 'SUCCESS'
+               AND completed_at IS NOT NULL
+               AND success_stage IS NULL
+        """)
+
+    def init(self):
+        # Balayage des QR expirés : index partiel limité aux transactions ouvertes portant un QR
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS orange_money_transaction_qr_valid_until_idx
+                ON orange_money_transaction (valid_until)
+             WHERE status IN ('INITIATED', 'PENDING', 'ACCEPTED')
+        """)
+        # Réservations orphelines : peu de lignes, balayées par date de création
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS orange_money_transaction_pre_initiated_idx
+                ON orange_money_transaction (create_date)
+             WHERE status = 'PRE_INITIATED'
+        """)
+        # Flux de changements : identifiant de la transaction SQL qui a écrit la ligne en dernier,
+        # posé par trigger (ORM comme UPDATE bruts) et parcouru par (change_txid, id). Une mise à
+        # jour ne compte que si une colonne servie par le flux change (pas la rétention, par ex.)
+        served = [column for column in self._CHANGES_COLUMNS if column != 'id']
+        old_row = ', '.join(f'OLD."{column}"' for column in served)
+        new_row = ', '.join(f'NEW."{column}"' for column in served)
+        self.env.cr.execute(f"""
+            ALTER TABLE orange_money_transaction ADD COLUMN IF NOT EXISTS change_txid bigint NOT NULL DEFAULT 0;
+
+            CREATE OR REPLACE FUNCTION orange_money_transaction_set_change_txid() RETURNS trigger AS $$
+            BEGIN
+                NEW.change_txid := txid_current();
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql;
+
+            DROP TRIGGER IF EXISTS orange_money_transaction_change_txid ON orange_money_transaction;
+            DROP TRIGGER IF EXISTS orange_money_transaction_change_txid_insert ON orange_money_transaction;
+            CREATE TRIGGER orange_money_transaction_change_txid_insert
+                BEFORE INSERT ON orange_money_transaction
+                FOR EACH ROW EXECUTE FUNCTION orange_money_transaction_set_change_txid();
+            CREATE TRIGGER orange_money_transaction_change_txid
+                BEFORE UPDATE ON orange_money_transaction
+                FOR EACH ROW
+                WHEN (({old_row}) IS DISTINCT FROM ({new_row}))
+                EXECUTE FUNCTION orange_money_transaction_set_change_txid();
+
+            CREATE INDEX IF NOT EXISTS orange_money_transaction_change_txid_id_idx
+                ON orange_money_transaction (change_txid, id);
+        """)
+        # Métadonnées : containment (@>) via GIN, clés les plus recherchées via index d'expression
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS orange_money_transaction_metadata_gin_idx
+                ON orange_money_transaction USING gin (metadata jsonb_path_ops)
+        """)
+        for key in ('order_id', 'reference'):
+            self.env.cr.execute(f"""
+                CREATE INDEX IF NOT EXISTS orange_money_transaction_metadata_{key}_idx
+                    ON orange_money_transaction ((metadata->>'{key}'))
+            """)
+        # MSISDN normalisé : recherche exacte (l'index trigramme du champ sert les fragments)
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS orange_money_transaction_msisdn_e164_idx
+                ON orange_money_transaction (customer_msisdn_e164)
+             WHERE customer_msisdn_e164 IS NOT NULL
+        """)
+
+    # ============================
+    # FLUX DE CHANGEMENTS
+    # ============================
+    # Colonnes renvoyées par le flux : de quoi synchroniser un système tiers, sans blob
+    _CHANGES_COLUMNS = (
+        'id', 'transaction_id', 'reference', 'status', 'amount', 'currency',
+        'account_move_id', 'partner_id', 'payment_id', 'completed_at', 'write_date',
+    )
+    # Ordre de validation, pas d'horodatage : write_date vaut le début de la transaction SQL,
+    # qui peut valider bien après qu'un curseur plus récent a été rendu. Seules sont servies les
+    # lignes écrites par des transactions antérieures à la plus ancienne encore en cours
+    # (txid_snapshot_xmin) : aucune ligne ne peut plus apparaître derrière le curseur.
+
+    @api.model
+    def _encode_changes_cursor(self, change_txid, record_id):
+        return f"t{change_txid}_{record_id}"
+
+    @api.model
+    def _decode_changes_cursor(self, cursor):
+        """« t<change_txid>_<id> » -> (change_txid, id) ; ValueError si le curseur est invalide."""
+        position, separator, record_id = cursor.partition('_')
+        if not separator or not position.startswith('t'):
+            raise ValueError(f"Curseur invalide : {cursor}")
+        return int(position[1:]), int(record_id)
+
+    @api.model
+    def _read_changes(self, since=None, limit=200):
+        """
+        Transactions modifiées après le curseur, dans l'ordre de validation (change_txid, id) :
+        une seule requête sur l'index composite. Retourne (lignes, curseur suivant, encore des lignes ?).
+        Une ligne modifiée de nouveau est resservie (au moins une fois par modification).
+        """
+        self.flush_model()
+        where = ["change_txid < txid_snapshot_xmin(txid_current_snapshot())"]
+        params = []
+        if since:
+            where.append("(change_txid, id) > (%s, %s)")
+            params.extend(self._decode_changes_cursor(since))
+        self.env.cr.execute(f"""
+            SELECT {', '.join(self._CHANGES_COLUMNS)}, change_txid
+              FROM orange_money_transaction
+             WHERE {' AND '.join(where)}
+             ORDER BY change_txid, id
+             LIMIT %s
+        """, params + [limit + 1])
+        rows = self.env.cr.dictfetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = self._encode_changes_cursor(rows[-1]['change_txid'], rows[-1]['id']) if rows else since
+        for row in rows:
+            del row['change_txid']
+        return rows, next_cursor, has_more
+
+    # ============================
+    # PAIEMENT & RÉCONCILIATION
+    # ============================
+    def _get_payable_transactions(self):
+        """Transactions SUCCESS pour lesquelles un paiement peut encore être créé."""
+        payable = self.browse()
+        for record in self:
+            if record.status != 'SUCCESS' or record.payment_id or record.settlement_id:
+                continue
+            if not record.account_move_id:
+                _logger.error("Aucune facture liée à la transaction %s.", record.transaction_id)
+                continue
+            if not record.partner_id:
+                _logger.error("Aucun client lié à la transaction %s.", record.transaction_id)
+                continue
+            invoice = record.account_move_id
+            if invoice.state == 'posted' and invoice.payment_state in ('paid', 'in_payment'):
+                _logger.info(
+                    "Facture %s déjà payée, aucun paiement créé pour la transaction %s.",
+                    invoice.name, record.transaction_id
+                )
+                continue
+            payable |= record
+        return payable
+
+    def _get_payment_journal_and_method(self):
+        """Journal (bank/cash) et méthode de paiement entrante, recherchés une seule fois par lot."""
+        journal = self.env['account.journal'].search([
+            ('type', 'in', ['bank', 'cash']),
+            ('company_id', '=', self.env.company.id)
+        ], limit=1)
+        if not journal:
+            _logger.error("Aucun journal de paiement (bank/cash) trouvé pour la compagnie.")
+
+        payment_method = self.env['account.payment.method'].search([
+            ('payment_type', '=', 'inbound')
+        ], limit=1)
+        if not payment_method:
+            _logger.error("Aucune méthode de paiement trouvée.")
+
+        return journal, payment_method
+
+    def _prepare_payment_vals(self, journal, payment_method):
+        self.ensure_one()
+        return {
+            'payment_type': 'inbound',
+            'partner_type': 'customer',
+            'partner_id': self.partner_id.id,
+            'amount': self.amount,
+            'journal_id': journal.id,
+            'currency_id': self.account_move_id.currency_id.id,
+            'payment_method_id': payment_method.id,
+            'ref': f"Paiement Orange Money - {self.reference}",
+        }
+
+    def _create_payments_batch(self):
+        """
+        Moteur de paiement en lot : crée et poste en une fois les paiements
+        de toutes les transactions SUCCESS du recordset, puis réconcilie les
+        lignes clients par facture.
+        """
+        transactions = self._get_payable_transactions()
+        if not transactions:
+            return self.env['account.payment']
+
+        journal, payment_method = self._get_payment_journal_and_method()
+        if not journal or not payment_method:
+            return self.env['account.payment']
 
-    def _reconcile_payment_with_invoice(self, payment, invoice):
-        """Réconciliation classique (compatible v14+)."""
         try:
-            invoice_lines = invoice.line_ids.filtered(
-                lambda line: line.account_id.account_type == 'asset_receivable' and not line.reconciled
+            with self.env.cr.savepoint():
+                payments = transactions._create_and_post_payments(journal, payment_method)
+        except Exception as e:
+            # Un paiement invalide ne doit pas bloquer tout le lot : reprise transaction par transaction
+            _logger.warning(
+                "Échec de la création en lot de %s paiements (%s), reprise transaction par transaction.",
+                len(transactions), str(e)
             )
-            if not invoice_lines:
-                invoice_lines = invoice.line_ids.filtered(
-                    lambda line: line.account_id.internal_type == 'receivable' and not line.reconciled
-                )
+            payments = self.env['account.payment']
+            for record in transactions:
+                try:
+                    with self.env.cr.savepoint():
+                        payments |= record._create_and_post_payments(journal, payment_method)
+                except Exception as err:
+                    _logger.error(
+                        "Erreur lors de la création du paiement pour la transaction %s: %s",
+                        record.transaction_id, str(err)
+                    )
 
-            payment_lines = payment.move_id.line_ids.filtered(
-                lambda line: line.account_id.account_type == 'asset_receivable'
+        transactions.filtered('payment_id')._reconcile_payments_batch()
+        return payments
+
+    def _create_and_post_payments(self, journal, payment_method):
+        vals_list = [record._prepare_payment_vals(journal, payment_method) for record in self]
+        payments = self.env['account.payment'].create(vals_list)
+        payments.action_post()
+        for record, payment in zip(self, payments):
+            record.payment_id = payment
+        _logger.info("%s paiement(s) Orange Money créé(s) et validé(s)", len(payments))
+        return payments
+
+    def _get_receivable_line_domain(self):
+        """Domaine des lignes clients (account_type en v16+, internal_type avant)."""
+        if 'account_type' in self.env['account.account']._fields:
+            return [('account_id.account_type', '=', 'asset_receivable')]
+        return [('account_id.internal_type', '=', 'receivable')]
+
+    def _reconcile_payments_batch(self):
+        """Réconcilier les lignes clients des factures et de leurs paiements, groupées par facture."""
+        try:
+            moves = self.mapped('payment_id.move_id') | self.mapped('account_move_id')
+            lines = self.env['account.move.line'].search(
+                [('move_id', 'in', moves.ids), ('reconciled', '=', False)]
+                + self._get_receivable_line_domain()
             )
-            if not payment_lines:
-                payment_lines = payment.move_id.line_ids.filtered(
-                    lambda line: line.account_id.internal_type == 'receivable'
-                )
 
-            lines_to_reconcile = invoice_lines + payment_lines
-            if lines_to_reconcile:
-                lines_to_reconcile.reconcile()
-                _logger.info(
-                    "Paiement %s réconcilié avec la facture %s",
-                    payment.name, invoice.name
-                )
-            else:
-                _logger.warning(
-                    "Aucune ligne à réconcilier trouvée pour le paiement %s et la facture %s",
-                    payment.name, invoice.name
-                )
+            # Chaque ligne de paiement est rattachée à la facture de sa transaction
+            invoice_by_move = {record.payment_id.move_id.id: record.account_move_id for record in self}
+            groups = defaultdict(lambda: self.env['account.move.line'])
+            for line in lines:
+                invoice = invoice_by_move.get(line.move_id.id, line.move_id)
+                groups[(invoice, line.account_id)] |= line
+
+            for (invoice, account), group in groups.items():
+                if len(group.move_id) < 2:
+                    _logger.warning("Aucune ligne à réconcilier trouvée pour la facture %s", invoice.name)
+                    continue
+                try:
+                    with self.env.cr.savepoint():
+                        group.reconcile()
+                    _logger.info("Paiement(s) réconcilié(s) avec la facture %s", invoice.name)
+                except Exception as e:
+                    _logger.error("Erreur lors de la réconciliation de la facture %s: %s", invoice.name, str(e))
         except Exception as e:
             _logger.error(f"Erreur lors de la réconciliation du paiement: {str(e)}")
 
+    def action_create_payments(self):
+        """Action serveur : traiter en une passe les transactions SUCCESS sans paiement."""
+        payments = self._create_payments_batch()
+        for record in self.filtered(lambda t: t.payment_id in payments):
+            vals = record._auto_save_invoice_info()
+            if vals:
+                record.write(vals)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'Paiements créés',
+                'message': f'{len(payments)} paiement(s) créé(s) et réconcilié(s).',
+                'type': 'success' if payments else 'info',
+            }
+        }
+
+    @api.model
+    def _cron_process_success_backlog(self, limit=500):
+        """Reprise (ex. après une panne) des transactions SUCCESS dont le pipeline est inachevé."""
+        transactions = self.search([
+            ('status', '=', 'SUCCESS'),
+            ('success_stage', '!=', 'done'),
+        ], limit=limit, order='completed_at asc, id asc')
+        if transactions:
+            _logger.info("Reprise du traitement de %s transaction(s) Orange Money réussie(s)", len(transactions))
+            transactions.with_context(om_status_source='cron')._run_success_pipeline()
+
     def action_check_status(self):
         """Bouton simple pour vérifier & afficher une notif."""
         self.ensure_one()
@@ -2146,7 +2959,7 @@ class OrangeMoneyTransaction(models.Model):
                     }
                 }
 
-            api_response = config.get_transaction_status(transactionId)
+            api_response = config.with_context(om_status_source='backoffice').get_transaction_status(transactionId)
 
             if not api_response:
                 _logger.error(f"Aucune transaction API trouvée avec l'ID: {transactionId}")
@@ -2182,6 +2995,316 @@ class OrangeMoneyTransaction(models.Model):
                 }
             }
 
+    # ============================
+    # EXPIRATION
+    # ============================
+    @api.model
+    def _get_expiry_cutoff(self, config):
+        grace = config.expiry_grace_minutes if config else 0
+        return fields.Datetime.now() - timedelta(minutes=grace)
+
+    @api.model
+    def _verify_expired_upstream(self, config, cutoff, limit):
+        """
+        Avant d'expirer, demander à Orange (en parallèle) le statut final des transactions
+        échues : un paiement réussi au dernier moment doit passer en SUCCESS, pas en échec.
+        """
+        candidates = self.search([
+            ('status', 'in', QR_OPEN_STATUSES),
+            ('valid_until', '<', cutoff),
+            ('transactionId', '!=', False),
+        ], order='valid_until asc', limit=limit)
+        if not candidates:
+            return
+        results = config._fetch_transaction_statuses(candidates.mapped('transactionId'), use_cache=False)
+        for record in candidates.with_context(om_status_source='cron'):
+            result = results.get(record.transactionId) or {}
+            if not result.get('success'):
+                continue
+            status = self._map_orange_status((result['data'].get('status') or '').upper())
+            if status in TERMINAL_STATUSES and status != record.status:
+                record._set_status(status, {'orange_response': result['data']})
+
+    @api.model
+    def _expire_transactions(self, cutoff, limit):
+        """
+        Passer en FAILED (raison EXPIRED), en un seul UPDATE, les transactions ouvertes dont
+        le QR a expiré, et libérer leurs colonnes QR. Les lignes verrouillées par un webhook
+        ou un poll en cours sont laissées au passage suivant.
+        """
+        self.flush_model()
+        self.env.cr.execute("""
+            WITH expired AS (
+                SELECT id, status
+                  FROM orange_money_transaction
+                 WHERE status IN %s
+                   AND valid_until < %s
+                 ORDER BY valid_until
+                 LIMIT %s
+                   FOR UPDATE SKIP LOCKED
+            )
+            UPDATE orange_money_transaction t
+               SET status = 'FAILED',
+                   status_reason = 'EXPIRED',
+                   qr_code_base64 = NULL,
+                   orange_response = NULL,
+                   updated_at = now() at time zone 'UTC',
+                   write_date = now() at time zone 'UTC',
+                   write_uid = %s
+              FROM expired e
+             WHERE t.id = e.id
+            RETURNING t.id, e.status
+        """, (QR_OPEN_STATUSES, cutoff, limit, self.env.uid))
+        from_statuses = dict(self.env.cr.fetchall())
+        expired = self.browse(list(from_statuses))
+        if not expired:
+            return expired
+
+        # Ce que write() aurait fait : cache, journal des statuts, bus
+        expired.invalidate_recordset(['status', 'status_reason', 'qr_code_base64', 'orange_response', 'updated_at'])
+        self.env['orange.money.status.event']._log_transitions(expired, 'FAILED', 'cron', from_statuses=from_statuses)
+        expired._notify_status_bus()
+        return expired
+
+    @api.model
+    def _release_stale_reservations(self, cutoff, limit):
+        """
+        Supprimer les réservations PRE_INITIATED plus anciennes que `cutoff` : l'initiation a été
+        interrompue entre deux phases. Comme la reprise faite par /initiate, la suppression
+        laisse le client réessayer avec le même transaction_id.
+        """
+        self.flush_model(['status'])
+        self.env.cr.execute("""
+            SELECT id
+              FROM orange_money_transaction
+             WHERE status = 'PRE_INITIATED'
+               AND create_date < %s
+             ORDER BY create_date
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+        """, (cutoff, limit))
+        stale = self.browse([row[0] for row in self.env.cr.fetchall()])
+        if stale:
+            stale.unlink()
+        return len(stale)
+
+    @api.model
+    def _cron_expire_transactions(self, limit=1000):
+        """Clôturer les transactions dont le QR a expiré (vérification Orange optionnelle)."""
+        config = self.env['orange.money.config'].sudo().search([('is_active', '=', True)], limit=1)
+        released = self._release_stale_reservations(self._get_stale_reservation_cutoff(config), limit)
+        if released:
+            _logger.info("%s réservation(s) Orange Money orpheline(s) supprimée(s)", released)
+        cutoff = self._get_expiry_cutoff(config)
+        if config and config.expiry_verify_upstream:
+            self._verify_expired_upstream(config, cutoff, limit)
+        expired = self._expire_transactions(cutoff, limit)
+        if expired:
+            _logger.info("%s transaction(s) Orange Money expirée(s)", len(expired))
+        if len(expired) == limit or released == limit:
+            # Il en reste : on se reprogramme immédiatement
+            self.env.ref(f'{self._module}.ir_cron_orange_money_expiry')._trigger()
+
+    # ============================
+    # RÉSERVATIONS PRE_INITIATED
+    # ============================
+    # Au-delà, une réservation est orpheline : l'initiation (appel QR de 30 s au plus)
+    # a été interrompue entre deux phases. Valeur par défaut, réglable sur la configuration.
+    _RESERVATION_TIMEOUT_MINUTES = 2
+
+    @api.model
+    def _get_stale_reservation_cutoff(self, config=None):
+        if config is None:
+            config = self.env['orange.money.config'].sudo().search([('is_active', '=', True)], limit=1)
+        minutes = config.reservation_timeout_minutes if config else self._RESERVATION_TIMEOUT_MINUTES
+        return fields.Datetime.now() - timedelta(minutes=max(minutes, 1))
+
+    def _is_stale_reservation(self):
+        self.ensure_one()
+        return self.status == 'PRE_INITIATED' and self.create_date < self._get_stale_reservation_cutoff()
+
+    # ============================
+    # RÉTENTION
+    # ============================
+    # Réponses brutes conservées (compressées) dans orange.money.payload.archive
+    _ARCHIVED_PAYLOAD_FIELDS = ('orange_response', 'webhook_data')
+
+    @api.model
+    def _release_payloads(self, cutoff, limit, archive=True, purge_receipts=False):
+        """
+        Retirer des transactions finales plus anciennes que `cutoff` leurs colonnes volumineuses
+        (réponses Orange, webhook, QR, et reçus PDF si demandé). Ni write_date, ni le journal
+        des statuts, ni le flux de changements (aucune colonne servie ne change) ne bougent :
+        la transaction elle-même n'a pas changé.
+        """
+        self.flush_model()
+        self.env.cr.execute("""
+            SELECT id
+              FROM orange_money_transaction
+             WHERE status IN %s
+               AND (status != 'SUCCESS' OR success_stage = 'done')
+               AND COALESCE(completed_at, updated_at, create_date) < %s
+               AND (orange_response IS NOT NULL
+                    OR webhook_data IS NOT NULL
+                    OR qr_code_base64 IS NOT NULL
+                    OR (%s AND url_facture IS NOT NULL))
+             ORDER BY id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+        """, (TERMINAL_STATUSES, cutoff, purge_receipts, limit))
+        released = self.browse([row[0] for row in self.env.cr.fetchall()])
+        if not released:
+            return released
+
+        if archive:
+            self.env['orange.money.payload.archive']._archive_payloads(released, self._ARCHIVED_PAYLOAD_FIELDS)
+        # facture_generated_at aussi : sans lui, _get_receipt_url ne renvoie plus de lien /receipt mort
+        receipt_sql = ", url_facture = NULL, facture_size = 0, facture_generated_at = NULL" if purge_receipts else ""
+        self.env.cr.execute(f"""
+            UPDATE orange_money_transaction
+               SET orange_response = NULL,
+                   webhook_data = NULL,
+                   qr_code_base64 = NULL{receipt_sql}
+             WHERE id IN %s
+        """, (tuple(released.ids),))
+        released.invalidate_recordset([
+            'orange_response', 'webhook_data', 'qr_code_base64', 'url_facture', 'facture_size', 'facture_generated_at',
+        ])
+
+        if purge_receipts:
+            # Pièce jointe du champ facture_pdf et copie publique derrière url_facture
+            self.env['ir.attachment'].sudo().search([
+                ('res_model', '=', self._name),
+                ('res_id', 'in', released.ids),
+                ('res_field', 'in', [False, 'facture_pdf']),
+                ('mimetype', '=', 'application/pdf'),
+            ]).unlink()
+            released.invalidate_recordset(['facture_pdf'])
+        return released
+
+    @api.model
+    def _cron_apply_retention(self, limit=1000):
+        """Appliquer la politique de rétention de la configuration active, par lots."""
+        config = self.env['orange.money.config'].sudo().search([('is_active', '=', True)], limit=1)
+        if not config:
+            return
+        now = fields.Datetime.now()
+        full_batch = False
+        if config.payload_retention_days > 0:
+            cutoff = now - timedelta(days=config.payload_retention_days)
+            released = self._release_payloads(
+                cutoff, limit,
+                archive=config.payload_retention_mode == 'archive',
+                purge_receipts=config.retention_purge_receipts,
+            )
+            events = self.env['orange.money.webhook.event']._purge_processed(cutoff, limit)
+            if released or events:
+                _logger.info(
+                    "Rétention Orange Money : %s transaction(s) allégée(s), %s webhook(s) supprimé(s)",
+                    len(released), events
+                )
+            full_batch = len(released) == limit or events == limit
+        if config.transaction_archive_days > 0:
+            cutoff = now - timedelta(days=config.transaction_archive_days)
+            archived = self.env['orange.money.transaction.archive']._archive_transactions(cutoff, limit)
+            if archived:
+                _logger.info("Rétention Orange Money : %s transaction(s) archivée(s)", archived)
+            full_batch = full_batch or archived == limit
+        if full_batch:
+            # Il en reste : on se reprogramme immédiatement
+            self.env.ref(f'{self._module}.ir_cron_orange_money_retention')._trigger()
+
+    # ============================
+    # WEBHOOK
+    # ============================
+    @api.model
+    def _map_orange_status(self, orange_status):
+        """Mapper les statuts Orange Money vers les statuts internes du modèle."""
+        status_mapping = {
+            'SUCCESS': 'SUCCESS',
+            'SUCCEEDED': 'SUCCESS',
+            'FAILED': 'FAILED',
+            'PENDING': 'PENDING',
+            'PROCESSING': 'PENDING',
+            'EXPIRED': 'FAILED',    # EXPIRED -> FAILED
+            'CANCELLED': 'CANCELLED',
+            'CANCELED': 'CANCELLED',
+            'REJECTED': 'REJECTED',
+        }
+        return status_mapping.get((orange_status or '').upper(), 'PENDING')
+
+    @api.model
+    def _apply_webhook_payload(self, data):
+        """
+        Appliquer une notification Orange Money (déjà décodée) à la transaction Odoo.
+        Utilisé par le worker de la boîte de réception des webhooks.
+        """
+        amount_data = data.get('amount')
+        customer = data.get('customer', {}) or {}
+        partner = data.get('partner', {}) or {}
+        status = (data.get('status') or '').upper()
+        metadata = data.get('metadata', {}) or {}
+
+        # Métadonnées éventuellement stringifiées
+        if isinstance(metadata, str):
+            try:
+                metadata = json.loads(metadata)
+            except json.JSONDecodeError:
+                _logger.error("Erreur de décodage JSON dans les métadonnées")
+                return {'status': 'error', 'message': 'Erreur de décodage JSON dans les métadonnées'}
+
+        # On standardise le champ qui identifie la transaction côté Odoo
+        transaction_id = metadata.get('transaction_id') or metadata.get('reference') or ''
+        if not transaction_id:
+            _logger.error("Aucun transaction_id dans les métadonnées")
+            return {'status': 'error', 'message': 'transaction_id manquant dans les métadonnées'}
+
+        transaction_om = self.search([('transaction_id', '=', transaction_id)], limit=1)
+        if not transaction_om:
+            # Le webhook peut précéder le commit de l'initiation : on réessaiera plus tard
+            _logger.warning(f"Transaction non trouvée pour transaction_id : {transaction_id}")
+            return {'status': 'error', 'message': 'Transaction non trouvée', 'retry': True}
+
+        # Extraction du montant
+        if isinstance(amount_data, dict):
+            amount_value = amount_data.get('value') or amount_data.get('amount')
+        else:
+            amount_value = amount_data
+
+        vals = {
+            'updated_at': fields.Datetime.now(),
+            'webhook_data': data,
+            'transactionId': data.get('transactionId'),
+            'channel': data.get('channel') or '',
+            'payment_method': data.get('paymentMethod') or '',
+            'transaction_type': data.get('type') or '',
+            'partnerId': partner.get('id') or '',
+            'partnerId_type': partner.get('idType') or '',
+            'customer_id': customer.get('id') or '',
+            'customer_id_type': customer.get('idType') or '',
+        }
+
+        # On met à jour le montant si besoin (et si pas déjà renseigné)
+        if amount_value and not transaction_om.amount:
+            try:
+                vals['amount'] = float(amount_value)
+            except Exception:
+                _logger.warning(f"Impossible de caster le montant {amount_value} en float")
+
+        # Ce write déclenche toute la logique SUCCESS du modèle (PDF, paiement, mail).
+        # Le worker peut attendre le verrou : un seul processus applique la transition.
+        new_status = self._map_orange_status(status)
+        if not transaction_om.with_context(om_status_source='webhook')._set_status(new_status, vals, nowait=False):
+            # Sans NOWAIT, False signifie transition refusée : l'événement doit rester visible
+            message = f"Transition refusée : {transaction_om.status} -> {new_status}"
+            _logger.warning("Webhook non appliqué à la transaction %s : %s", transaction_id, message)
+            return {'status': 'error', 'message': message}
+        _logger.info(
+            "Webhook appliqué à la transaction %s : statut %s -> %s",
+            transaction_id, status, transaction_om.status
+        )
+        return {'status': 'success', 'message': 'Transaction mise à jour avec succès'}
+
     # ============================
     # CONTRAINTE SQL
     # ============================
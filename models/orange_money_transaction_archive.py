@@ -0,0 +1,84 @@
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+import logging
+
+from .orange_money_transaction import TERMINAL_STATUSES
+
+_logger = logging.getLogger(__name__)
+
+
+class OrangeMoneyTransactionArchive(models.Model):
+    """
+    Transactions finales anciennes sorties de la table chaude : seules les colonnes utiles
+    au reporting et au rapprochement sont conservées. Voir orange.money.transaction.report
+    pour une lecture unifiée (chaud + archive).
+    """
+    _name = 'orange.money.transaction.archive'
+    _description = 'Transaction Orange Money archivée'
+    _order = 'created_at desc, id desc'
+    _rec_name = 'reference'
+    _log_access = False
+
+    original_id = fields.Integer(string="ID d'origine", index=True, readonly=True)
+    transaction_id = fields.Char(string="ID de transaction", index=True, readonly=True)
+    transactionId = fields.Char(string="ID Orange", readonly=True)
+    reference = fields.Char(string="Référence", readonly=True)
+    status = fields.Char(string="Statut", readonly=True)
+    status_reason = fields.Char(string="Raison du statut", readonly=True)
+    amount = fields.Float(string="Montant", digits=(16, 2), readonly=True)
+    currency = fields.Char(string="Devise", readonly=True)
+    customer_msisdn = fields.Char(string="Numéro client", readonly=True)
+    partner_id = fields.Many2one('res.partner', string="Client", index=True, ondelete='set null', readonly=True)
+    account_move_id = fields.Many2one('account.move', string="Facture", index=True, ondelete='set null', readonly=True)
+    payment_id = fields.Many2one('account.payment', string="Paiement", ondelete='set null', readonly=True)
+    settlement_id = fields.Many2one('orange.money.settlement', string="Règlement", ondelete='set null', readonly=True)
+    created_at = fields.Datetime(string="Date de création", readonly=True)
+    completed_at = fields.Datetime(string="Date de completion", readonly=True)
+    archived_at = fields.Datetime(string="Archivé le", default=fields.Datetime.now, readonly=True)
+
+    # Colonnes copiées telles quelles de orange_money_transaction
+    _ARCHIVED_COLUMNS = (
+        'transaction_id', 'transactionId', 'reference', 'status', 'status_reason', 'amount',
+        'currency', 'customer_msisdn', 'partner_id', 'account_move_id', 'payment_id',
+        'settlement_id', 'created_at', 'completed_at',
+    )
+
+    def write(self, vals):
+        raise UserError("Les archives Orange Money ne peuvent pas être modifiées.")
+
+    @api.model
+    def _archive_transactions(self, cutoff, limit):
+        """
+        Copier en un INSERT ... SELECT les transactions finales plus anciennes que `cutoff`,
+        puis les supprimer de la table chaude. Une transaction SUCCESS n'est archivée qu'une fois
+        son pipeline terminé et son encaissement comptabilisé (paiement ou règlement).
+        """
+        Transaction = self.env['orange.money.transaction']
+        Transaction.flush_model()
+        self.env.cr.execute("""
+            SELECT id
+              FROM orange_money_transaction
+             WHERE status IN %s
+               AND (status != 'SUCCESS'
+                    OR (success_stage = 'done'
+                        AND (payment_id IS NOT NULL OR settlement_id IS NOT NULL OR account_move_id IS NULL)))
+               AND COALESCE(completed_at, updated_at, create_date) < %s
+             ORDER BY id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+        """, (TERMINAL_STATUSES, cutoff, limit))
+        ids = [row[0] for row in self.env.cr.fetchall()]
+        if not ids:
+            return 0
+
+        columns = ', '.join(f'"{name}"' for name in self._ARCHIVED_COLUMNS)
+        self.env.cr.execute(f"""
+            INSERT INTO orange_money_transaction_archive (original_id, {columns}, archived_at)
+            SELECT id, {columns}, now() at time zone 'UTC'
+              FROM orange_money_transaction
+             WHERE id IN %s
+        """, (tuple(ids),))
+        # unlink() ORM : pièces jointes, messages et totaux des factures restent cohérents
+        Transaction.browse(ids).with_context(om_status_source='cron').unlink()
+        return len(ids)
+
@@ -0,0 +1,44 @@
+from odoo import models, fields, tools
+
+
+class OrangeMoneyTransactionReport(models.Model):
+    """
+    Analyse des transactions Orange Money : vue SQL sur la table chaude et la table
+    d'archive, pour que le reporting ne dépende pas de la politique de rétention.
+    """
+    _name = 'orange.money.transaction.report'
+    _description = 'Analyse des transactions Orange Money'
+    _auto = False
+    _order = 'created_at desc'
+    _rec_name = 'reference'
+
+    source = fields.Selection([
+        ('live', 'Active'),
+        ('archive', 'Archivée'),
+    ], string="Origine", readonly=True)
+    transaction_id = fields.Char(string="ID de transaction", readonly=True)
+    reference = fields.Char(string="Référence", readonly=True)
+    status = fields.Char(string="Statut", readonly=True)
+    amount = fields.Float(string="Montant", digits=(16, 2), readonly=True)
+    currency = fields.Char(string="Devise", readonly=True)
+    partner_id = fields.Many2one('res.partner', string="Client", readonly=True)
+    account_move_id = fields.Many2one('account.move', string="Facture", readonly=True)
+    created_at = fields.Datetime(string="Date de création", readonly=True)
+    completed_at = fields.Datetime(string="Date de completion", readonly=True)
+
+    def init(self):
+        # Identifiants disjoints : pairs pour les transactions actives, impairs pour les archives
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute(f"""
+            CREATE OR REPLACE VIEW {self._table} AS (
+                SELECT t.id * 2 AS id, 'live' AS source,
+                       t.transaction_id, t.reference, t.status, t.amount, t.currency,
+                       t.partner_id, t.account_move_id, t.created_at, t.completed_at
+                  FROM orange_money_transaction t
+                UNION ALL
+                SELECT a.id * 2 + 1 AS id, 'archive' AS source,
+                       a.transaction_id, a.reference, a.status, a.amount, a.currency,
+                       a.partner_id, a.account_move_id, a.created_at, a.completed_at
+                  FROM orange_money_transaction_archive a
+            )
+        """)
@@ -0,0 +1,338 @@
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+import hashlib
+import json
+import logging
+import threading
+import psycopg2
+from collections import OrderedDict
+from functools import partial
+from datetime import timedelta
+
+_logger = logging.getLogger(__name__)
+
+
+class _FingerprintLRU:
+    """
+    Petit cache LRU (par processus) des empreintes d'événements déjà traités.
+    Les clés sont des couples (base, empreinte) : un processus peut servir plusieurs bases.
+    """
+
+    def __init__(self, maxsize=2048):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                return True
+            return False
+
+    def add(self, key):
+        with self._lock:
+            self._data[key] = True
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+_processed_fingerprints = _FingerprintLRU()
+
+# Erreurs passagères : l'événement repasse en attente au lieu d'échouer définitivement
+_TRANSIENT_ERRORS = (
+    psycopg2.errors.SerializationFailure,
+    psycopg2.errors.LockNotAvailable,
+    psycopg2.errors.DeadlockDetected,
+)
+
+
+class OrangeMoneyWebhookEvent(models.Model):
+    """
+    Boîte de réception des webhooks Orange Money.
+
+    Le contrôleur se contente d'insérer le corps brut et d'acquitter ;
+    le traitement (write, PDF, paiement, mail) est fait par le cron.
+    Le corps brut n'est jamais modifié : tout événement peut être rejoué.
+    """
+    _name = 'orange.money.webhook.event'
+    _description = 'Événement webhook Orange Money'
+    _order = 'id desc'
+
+    # Nouvelles tentatives : délai doublé à chaque échec passager, plafonné
+    _MAX_ATTEMPTS = 8
+    _RETRY_BASE_SECONDS = 30
+    _RETRY_MAX_SECONDS = 3600
+
+    payload = fields.Text(
+        string="Corps brut",
+        required=True,
+        readonly=True,
+        help="Corps HTTP reçu tel quel (jamais modifié)"
+    )
+
+    received_at = fields.Datetime(
+        string="Reçu le",
+        default=fields.Datetime.now,
+        required=True,
+        readonly=True
+    )
+
+    state = fields.Selection([
+        ('pending', 'En attente'),
+        ('done', 'Traité'),
+        ('error', 'Erreur'),
+    ], string="État", default='pending', required=True, index=True, readonly=True)
+
+    attempts = fields.Integer(
+        string="Tentatives",
+        default=0,
+        readonly=True
+    )
+
+    processed_at = fields.Datetime(
+        string="Traité le",
+        readonly=True
+    )
+
+    next_attempt_at = fields.Datetime(
+        string="Prochaine tentative",
+        readonly=True,
+        help="Après une erreur passagère, l'événement n'est pas repris avant cette date"
+    )
+
+    error_message = fields.Text(
+        string="Erreur",
+        readonly=True
+    )
+
+    fingerprint = fields.Char(
+        string="Empreinte",
+        index=True,
+        readonly=True,
+        help="Empreinte (transactionId, statut) servant à ignorer les renvois d'Orange"
+    )
+
+    @api.model
+    def _compute_fingerprint(self, raw_payload, data=None):
+        """Empreinte d'un événement : (transactionId, statut), ou le corps brut à défaut."""
+        if data is None:
+            try:
+                data = json.loads(raw_payload)
+            except (TypeError, ValueError):
+                data = None
+        if isinstance(data, dict) and data.get('transactionId'):
+            key = f"{data.get('transactionId')}|{(data.get('status') or '').upper()}"
+        else:
+            key = raw_payload or ''
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    @api.model
+    def _remember_processed(self, fingerprint):
+        """Mémoriser l'empreinte dans le cache, seulement une fois la transaction validée."""
+        if fingerprint:
+            key = (self.env.cr.dbname, fingerprint)
+            self.env.cr.postcommit.add(partial(_processed_fingerprints.add, key))
+
+    @api.model
+    def _is_duplicate(self, fingerprint):
+        """
+        Un événement identique a-t-il déjà été appliqué ?
+        Seuls les événements traités comptent : un frère encore en attente peut échouer
+        ou être replanifié, le renvoi est donc conservé et fusionné par _process.
+        """
+        if (self.env.cr.dbname, fingerprint) in _processed_fingerprints:
+            return True
+        self.env.cr.execute("""
+            SELECT 1
+              FROM orange_money_webhook_event
+             WHERE fingerprint = %s
+               AND state = 'done'
+             LIMIT 1
+        """, (fingerprint,))
+        if self.env.cr.fetchone():
+            self._remember_processed(fingerprint)
+            return True
+        return False
+
+    def write(self, vals):
+        """Table en ajout seul : le corps brut est immuable."""
+        if 'payload' in vals:
+            raise UserError("Le corps d'un événement webhook ne peut pas être modifié.")
+        return super().write(vals)
+
+    @api.model
+    def _enqueue(self, raw_payload, data=None):
+        """
+        Insérer l'événement brut et réveiller le worker.
+        Retourne False pour un doublon exact, acquitté sans rien écrire.
+        """
+        fingerprint = self._compute_fingerprint(raw_payload, data)
+        if self._is_duplicate(fingerprint):
+            return False
+        event = self.sudo().create({'payload': raw_payload, 'fingerprint': fingerprint})
+        cron = self.env.ref(f'{self._module}.ir_cron_orange_money_webhook_inbox', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+        return event
+
+    def _process(self):
+        """
+        Appliquer chaque événement à sa transaction, dans un savepoint par événement.
+        Les erreurs passagères (conflit de sérialisation, verrou, transaction pas encore
+        créée) replanifient l'événement ; les autres le passent en erreur.
+        """
+        Transaction = self.env['orange.money.transaction'].sudo()
+        force = self.env.context.get('om_force_replay')
+        for event in self:
+            # Frères en attente : le premier appliqué l'emporte, les suivants sont ignorés ici
+            if not force and event.state != 'done' and event.fingerprint and self.search_count([
+                ('fingerprint', '=', event.fingerprint),
+                ('state', '=', 'done'),
+                ('id', '!=', event.id),
+            ]):
+                # Renvoi d'un événement déjà appliqué : on ne touche pas à la transaction
+                self._remember_processed(event.fingerprint)
+                event.write({
+                    'state': 'done',
+                    'processed_at': fields.Datetime.now(),
+                    'next_attempt_at': False,
+                    'error_message': 'Doublon ignoré',
+                })
+                continue
+            try:
+                with self.env.cr.savepoint():
+                    data = json.loads(event.payload)
+                    result = Transaction._apply_webhook_payload(data)
+            except _TRANSIENT_ERRORS as e:
+                _logger.warning("Erreur passagère sur le webhook Orange Money %s : %s", event.id, str(e))
+                event._schedule_retry(str(e))
+                continue
+            except Exception as e:
+                _logger.error("Erreur lors du traitement du webhook Orange Money %s : %s", event.id, str(e))
+                event._mark_error(str(e))
+                continue
+            if result.get('status') == 'success':
+                event.write({
+                    'state': 'done',
+                    'attempts': event.attempts + 1,
+                    'processed_at': fields.Datetime.now(),
+                    'next_attempt_at': False,
+                    'error_message': False,
+                })
+                self._remember_processed(event.fingerprint)
+            elif result.get('retry'):
+                event._schedule_retry(result.get('message'))
+            else:
+                event._mark_error(result.get('message'))
+
+    def _mark_error(self, message):
+        """Échec définitif : l'événement reste disponible pour un rejeu manuel."""
+        self.ensure_one()
+        self.write({
+            'state': 'error',
+            'attempts': self.attempts + 1,
+            'processed_at': fields.Datetime.now(),
+            'next_attempt_at': False,
+            'error_message': message,
+        })
+
+    def _schedule_retry(self, message):
+        """Remettre l'événement en attente avec un délai exponentiel, jusqu'à _MAX_ATTEMPTS."""
+        self.ensure_one()
+        attempts = self.attempts + 1
+        if attempts >= self._MAX_ATTEMPTS:
+            self._mark_error(f"{message} (abandon après {attempts} tentatives)")
+            return
+        delay = min(self._RETRY_BASE_SECONDS * 2 ** (attempts - 1), self._RETRY_MAX_SECONDS)
+        next_attempt = fields.Datetime.now() + timedelta(seconds=delay)
+        self.write({
+            'state': 'pending',
+            'attempts': attempts,
+            'next_attempt_at': next_attempt,
+            'error_message': message,
+        })
+        cron = self.env.ref(f'{self._module}.ir_cron_orange_money_webhook_inbox', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger(at=next_attempt)
+
+    @api.model
+    def _claim_pending(self, limit=100):
+        """Réserver des événements dus ; SKIP LOCKED permet plusieurs workers en parallèle."""
+        self.env.cr.execute("""
+            SELECT id
+              FROM orange_money_webhook_event
+             WHERE state = 'pending'
+               AND (next_attempt_at IS NULL OR next_attempt_at <= (now() AT TIME ZONE 'UTC'))
+             ORDER BY id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+        """, (limit,))
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+
+    @api.model
+    def _cron_process_events(self, limit=100):
+        """
+        Traiter les événements un par un, chacun dans sa propre transaction :
+        un conflit de sérialisation ne se résout pas dans l'instantané qui l'a produit,
+        et le verrou d'un événement ne doit pas survivre à son commit.
+        """
+        processed = 0
+        while processed < limit:
+            event = self._claim_pending(limit=1)
+            if not event:
+                break
+            event._process()
+            self.env.cr.commit()
+            processed += 1
+        if processed:
+            _logger.info("%s webhook(s) Orange Money traité(s)", processed)
+        if processed == limit:
+            # Il en reste : on se reprogramme immédiatement
+            self.env.ref(f'{self._module}.ir_cron_orange_money_webhook_inbox')._trigger()
+
+    def init(self):
+        # Sélection des événements dus par le worker
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS orange_money_webhook_event_pending_idx
+                ON orange_money_webhook_event (next_attempt_at, id)
+             WHERE state = 'pending'
+        """)
+
+    @api.model
+    def _purge_processed(self, cutoff, limit=1000):
+        """
+        Supprimer les événements traités reçus avant `cutoff` (rétention des réponses brutes).
+        Les événements en attente ou en erreur sont conservés pour être rejoués.
+        """
+        self.flush_model()
+        self.env.cr.execute("""
+            DELETE FROM orange_money_webhook_event
+             WHERE id IN (
+                SELECT id
+                  FROM orange_money_webhook_event
+                 WHERE state = 'done'
+                   AND received_at < %s
+                 ORDER BY id
+                 LIMIT %s
+                   FOR UPDATE SKIP LOCKED
+             )
+        """, (cutoff, limit))
+        purged = self.env.cr.rowcount
+        if purged:
+            self.invalidate_model()
+        return purged
+
+    def action_replay(self):
+        """Rejouer un ou plusieurs événements stockés, quel que soit leur état."""
+        self.with_context(om_force_replay=True)._process()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'Webhooks rejoués',
+                'message': f'{len(self)} événement(s) rejoué(s).',
+                'type': 'success',
+            }
+        }
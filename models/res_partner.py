@@ -1,4 +1,11 @@
 from odoo import models, fields, api
+from odoo.tools.sql import column_exists
+import logging
+
+from .orange_money_transaction import backfill_msisdn_column, msisdn_search_domain, normalize_msisdn
+
+_logger = logging.getLogger(__name__)
+
 
 class ResPartner(models.Model):
     _inherit = 'res.partner'
@@ -7,6 +14,20 @@ class ResPartner(models.Model):
         string='Numéro Orange Money',
         help="Numéro de téléphone Orange Money du client"
     )
+
+    # Numéro normalisé : égalité via btree (init()), fragments via l'index trigramme
+    orange_money_msisdn_e164 = fields.Char(
+        string='Numéro Orange Money (E.164)',
+        compute='_compute_orange_money_msisdn_e164',
+        store=True,
+        index='trigram'
+    )
+
+    orange_money_msisdn_search = fields.Char(
+        string='Téléphone Orange Money',
+        compute='_compute_orange_money_msisdn_search',
+        search='_search_orange_money_msisdn'
+    )
     
     orange_money_transaction_ids = fields.One2many(
         'orange.money.transaction',
@@ -29,33 +50,164 @@ class ResPartner(models.Model):
         compute='_compute_orange_money_stats'
     )
 
-    # @api.depends('orange_money_transaction_ids.status', 'orange_money_transaction_ids.amount')
-    # def _compute_orange_money_stats(self):
-    #     for partner in self:
-    #         transactions = partner.orange_money_transaction_ids
-    #         partner.orange_money_transaction_count = len(transactions)
-            
-    #         successful_transactions = transactions.filtered(lambda t: t.status == 'SUCCESS')
-    #         partner.orange_money_total_amount = sum(successful_transactions.mapped('amount'))
-            
-    #         if transactions:
-    #             partner.orange_money_success_rate = (len(successful_transactions) / len(transactions)) * 100
-    #         else:
-    #             partner.orange_money_success_rate = 0.0
-
-    # def action_view_orange_money_transactions(self):
-    #     """Action pour voir les transactions Orange Money de ce client"""
-    #     return {
-    #         'name': f'Transactions Orange Money - {self.name}',
-    #         'type': 'ir.actions.act_window',
-    #         'view_mode': 'tree,form',
-    #         'res_model': 'orange.money.transaction',
-    #         'domain': [('partner_id', '=', self.id)],
-    #         'context': {
-    #             'default_partner_id': self.id,
-    #             'default_customer_msisdn': self.orange_money_msisdn,
-    #         },
-    #     }
+    # Instantané stocké pour les clients à gros historique (rafraîchi par le cron)
+    orange_money_snapshot_at = fields.Datetime(
+        string='Instantané Orange Money du',
+        readonly=True,
+        copy=False
+    )
+
+    orange_money_snapshot_count = fields.Integer(
+        string='Transactions OM (instantané)',
+        readonly=True,
+        copy=False
+    )
+
+    orange_money_snapshot_success_count = fields.Integer(
+        string='Transactions OM réussies (instantané)',
+        readonly=True,
+        copy=False
+    )
+
+    orange_money_snapshot_amount = fields.Float(
+        string='Montant OM (instantané)',
+        readonly=True,
+        copy=False
+    )
+
+    def _auto_init(self):
+        if column_exists(self.env.cr, self._table, 'orange_money_msisdn'):
+            backfill_msisdn_column(self.env.cr, self._table, 'orange_money_msisdn_e164', 'orange_money_msisdn')
+        return super()._auto_init()
+
+    def init(self):
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS res_partner_orange_money_msisdn_e164_idx
+                ON res_partner (orange_money_msisdn_e164)
+             WHERE orange_money_msisdn_e164 IS NOT NULL
+        """)
+
+    @api.depends('orange_money_msisdn')
+    def _compute_orange_money_msisdn_e164(self):
+        for partner in self:
+            partner.orange_money_msisdn_e164 = normalize_msisdn(partner.orange_money_msisdn)
+
+    def _compute_orange_money_msisdn_search(self):
+        for partner in self:
+            partner.orange_money_msisdn_search = partner.orange_money_msisdn_e164
+
+    def _search_orange_money_msisdn(self, operator, value):
+        return msisdn_search_domain('orange_money_msisdn_e164', operator, value)
+
+    def _compute_orange_money_stats(self):
+        """Une seule requête groupée pour tout le recordset ; l'instantané est utilisé s'il existe."""
+        live = self.env.context.get('om_live_stats')
+        stats = {}
+        for partner in self:
+            if partner.orange_money_snapshot_at and not live:
+                stats[partner._origin.id] = (
+                    partner.orange_money_snapshot_count,
+                    partner.orange_money_snapshot_success_count,
+                    partner.orange_money_snapshot_amount,
+                )
+
+        to_query = [pid for pid in self._origin.ids if pid not in stats]
+        if to_query:
+            stats.update(self._read_orange_money_aggregates(to_query))
+
+        for partner in self:
+            count, success_count, amount = stats.get(partner._origin.id, (0, 0, 0.0))
+            partner.orange_money_transaction_count = count
+            partner.orange_money_total_amount = amount
+            partner.orange_money_success_rate = (success_count / count) * 100 if count else 0.0
+
+    def _read_orange_money_aggregates(self, partner_ids):
+        """{partner_id: (nombre, nombre réussi, montant réussi)} en une requête, archives comprises."""
+        self.env['orange.money.transaction'].flush_model(['partner_id', 'status', 'amount'])
+        self.env.cr.execute("""
+            SELECT partner_id,
+                   COUNT(*),
+                   COUNT(*) FILTER (WHERE status = 'SUCCESS'),
+                   COALESCE(SUM(amount) FILTER (WHERE status = 'SUCCESS'), 0)
+              FROM (
+                    SELECT partner_id, status, amount FROM orange_money_transaction
+                     WHERE partner_id IN %s
+                    UNION ALL
+                    SELECT partner_id, status, amount FROM orange_money_transaction_archive
+                     WHERE partner_id IN %s
+                   ) t
+             GROUP BY partner_id
+        """, (tuple(partner_ids), tuple(partner_ids)))
+        return {row[0]: row[1:] for row in self.env.cr.fetchall()}
+
+    @api.model
+    def _cron_refresh_orange_money_snapshots(self):
+        """
+        Rafraîchir l'instantané des clients dont l'historique dépasse le seuil configuré,
+        en deux UPDATE ensemblistes (sans passer par le write() de res.partner).
+        """
+        config = self.env['orange.money.config'].sudo().search([('is_active', '=', True)], limit=1)
+        threshold = config.partner_snapshot_threshold if config else 0
+
+        self.env['orange.money.transaction'].flush_model(['partner_id', 'status', 'amount'])
+        if threshold > 0:
+            self.env.cr.execute("""
+                UPDATE res_partner p
+                   SET orange_money_snapshot_at = now() at time zone 'UTC',
+                       orange_money_snapshot_count = s.tx_count,
+                       orange_money_snapshot_success_count = s.success_count,
+                       orange_money_snapshot_amount = s.amount
+                  FROM (
+                        SELECT partner_id,
+                               COUNT(*) AS tx_count,
+                               COUNT(*) FILTER (WHERE status = 'SUCCESS') AS success_count,
+                               COALESCE(SUM(amount) FILTER (WHERE status = 'SUCCESS'), 0) AS amount
+                          FROM (
+                                SELECT partner_id, status, amount FROM orange_money_transaction
+                                UNION ALL
+                                SELECT partner_id, status, amount FROM orange_money_transaction_archive
+                               ) t
+                         WHERE partner_id IS NOT NULL
+                         GROUP BY partner_id
+                        HAVING COUNT(*) >= %s
+                       ) s
+                 WHERE p.id = s.partner_id
+                RETURNING p.id
+            """, (threshold,))
+            snapshot_ids = [row[0] for row in self.env.cr.fetchall()]
+        else:
+            snapshot_ids = []
+
+        # Les clients repassés sous le seuil (ou seuil désactivé) reviennent au calcul direct
+        self.env.cr.execute("""
+            UPDATE res_partner
+               SET orange_money_snapshot_at = NULL,
+                   orange_money_snapshot_count = 0,
+                   orange_money_snapshot_success_count = 0,
+                   orange_money_snapshot_amount = 0
+             WHERE orange_money_snapshot_at IS NOT NULL
+               AND NOT (id = ANY(%s))
+        """, (snapshot_ids,))
+
+        self.invalidate_model([
+            'orange_money_snapshot_at', 'orange_money_snapshot_count',
+            'orange_money_snapshot_success_count', 'orange_money_snapshot_amount',
+        ])
+        _logger.info("Instantané Orange Money rafraîchi pour %s client(s)", len(snapshot_ids))
+
+    def action_view_orange_money_transactions(self):
+        """Action pour voir les transactions Orange Money de ce client"""
+        return {
+            'name': f'Transactions Orange Money - {self.name}',
+            'type': 'ir.actions.act_window',
+            'view_mode': 'tree,form',
+            'res_model': 'orange.money.transaction',
+            'domain': [('partner_id', '=', self.id)],
+            'context': {
+                'default_partner_id': self.id,
+                'default_customer_msisdn': self.orange_money_msisdn,
+            },
+        }
 
     # @api.constrains('orange_money_msisdn')
     # def _check_orange_money_msisdn(self):
@@ -268,8 +268,8 @@ class SaleOrder(models.Model):
             'validity_seconds': data.get('validitySeconds'),
             'valid_from': data.get('validFrom'),
             'valid_until': data.get('validUntil'),
-            'orange_response': json.dumps(data),
-            'metadata': json.dumps(data.get('metadata', {})),
+            'orange_response': data,
+            'metadata': data.get('metadata', {}),
             'order_id': self.id,
             'partner_id': self.partner_id.id,
             'orange_id': data.get('qrId'),
@@ -0,0 +1,200 @@
+import json
+import threading
+import uuid
+from functools import partial
+from unittest.mock import patch
+
+from odoo import api, fields, SUPERUSER_ID
+from odoo.service.model import retrying
+from odoo.tests import tagged
+from odoo.tests.common import TransactionCase
+
+
+@tagged('post_install', '-at_install')
+class TestOrangeMoneyConcurrency(TransactionCase):
+    """
+    Webhook et interrogation portail appliquent SUCCESS à la même transaction
+    en même temps, chacun sur son propre curseur : une seule transition SUCCESS
+    et un seul paiement doivent en sortir.
+    Les données sont validées (commit) pour être visibles des deux curseurs,
+    puis supprimées à la fin du test.
+    """
+
+    ROUNDS = 5
+
+    def setUp(self):
+        super().setUp()
+        journal = self.env['account.journal'].search([
+            ('type', 'in', ['bank', 'cash']),
+            ('company_id', '=', self.env.company.id),
+        ], limit=1)
+        if not journal or not self.env['account.journal'].search([
+            ('type', '=', 'sale'), ('company_id', '=', self.env.company.id),
+        ], limit=1):
+            self.skipTest("Aucun plan comptable installé : pas de journaux de vente / banque.")
+        # Le PDF doit réussir pour que le pipeline atteigne le paiement ; wkhtmltopdf n'est pas requis ici
+        pdf_patcher = patch.object(
+            type(self.env['orange.money.transaction']), '_html_to_pdf', return_value=b'%PDF-1.4 test'
+        )
+        pdf_patcher.start()
+        self.addCleanup(pdf_patcher.stop)
+        self.tag = uuid.uuid4().hex[:8]
+        self.transaction_ids = []
+        with self.registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            partner = env['res.partner'].create({'name': f"Client OM {self.tag}"})
+            self.partner_id = partner.id
+            invoices = env['account.move'].create([{
+                'move_type': 'out_invoice',
+                'partner_id': partner.id,
+                'invoice_line_ids': [(0, 0, {'name': f"Article {self.tag}", 'quantity': 1, 'price_unit': 1000.0})],
+            } for _i in range(self.ROUNDS)])
+            invoices.action_post()
+            self.invoice_ids = invoices.ids
+            transactions = env['orange.money.transaction'].with_context(mail_create_nolog=True).create([{
+                'transaction_id': f"TEST-{self.tag}-{index}",
+                'reference': f"REF-{self.tag}-{index}",
+                'amount': invoice.amount_total,
+                'partner_id': partner.id,
+                'account_move_id': invoice.id,
+                'status': 'INITIATED',
+            } for index, invoice in enumerate(invoices)])
+            self.transaction_ids = transactions.ids
+        self.addCleanup(self._cleanup)
+
+    def _cleanup(self):
+        with self.registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            transactions = env['orange.money.transaction'].browse(self.transaction_ids).exists()
+            refs = transactions.mapped('transaction_id')
+            payments = transactions.mapped('payment_id')
+            env['orange.money.webhook.event'].search([('payload', 'like', self.tag)]).unlink()
+            cr.execute("DELETE FROM orange_money_status_event WHERE transaction_ref IN %s", (tuple(refs) or ('',),))
+            transactions.unlink()
+            if payments:
+                payments.action_draft()
+                payments.unlink()
+            invoices = env['account.move'].browse(self.invoice_ids).exists()
+            invoices.button_draft()
+            invoices.with_context(force_delete=True).unlink()
+            env['res.partner'].browse(self.partner_id).unlink()
+
+    def _run_concurrently(self, *targets):
+        """
+        Lancer les fonctions en parallèle, chacune sur son curseur, et relever leurs exceptions.
+        Comme une requête HTTP, chaque fonction est rejouée sur conflit de sérialisation.
+        """
+        barrier = threading.Barrier(len(targets))
+        errors = []
+
+        def runner(target):
+            try:
+                with self.registry.cursor() as cr:
+                    env = api.Environment(cr, SUPERUSER_ID, {})
+                    barrier.wait(timeout=30)
+                    retrying(partial(target, env), env)
+            except Exception as e:  # relevée dans le thread principal
+                errors.append(e)
+
+        threads = [threading.Thread(target=runner, args=(target,)) for target in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=120)
+        self.assertFalse(any(thread.is_alive() for thread in threads), "Un worker est resté bloqué")
+        return errors
+
+    def test_webhook_and_poll_pay_once(self):
+        for transaction_id in self.transaction_ids:
+            with self.registry.cursor() as cr:
+                env = api.Environment(cr, SUPERUSER_ID, {})
+                transaction = env['orange.money.transaction'].browse(transaction_id)
+                data = {
+                    'transactionId': f"OM-{transaction.transaction_id}",
+                    'status': 'SUCCESS',
+                    'amount': {'value': transaction.amount, 'unit': 'XOF'},
+                    'metadata': {'transaction_id': transaction.transaction_id},
+                }
+                self.assertTrue(env['orange.money.webhook.event']._enqueue(json.dumps(data), data))
+
+            def webhook_worker(env):
+                env['orange.money.webhook.event']._cron_process_events()
+
+            def status_poll(env, transaction_id=transaction_id):
+                transaction = env['orange.money.transaction'].browse(transaction_id)
+                transaction.with_context(om_status_source='poll')._set_status(
+                    'SUCCESS', {'updated_at': fields.Datetime.now()}
+                )
+
+            errors = self._run_concurrently(webhook_worker, status_poll)
+            self.assertFalse(errors, f"Erreur dans un worker : {errors}")
+
+        # Les événements replanifiés (conflit de sérialisation) et les pipelines
+        # interrompus sont repris comme le feraient les crons
+        with self.registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            cr.execute("""
+                UPDATE orange_money_webhook_event
+                   SET next_attempt_at = NULL
+                 WHERE state = 'pending' AND payload LIKE %s
+            """, (f'%{self.tag}%',))
+            env['orange.money.webhook.event'].invalidate_model(['next_attempt_at'])
+            env['orange.money.webhook.event']._cron_process_events()
+            env['orange.money.transaction']._cron_process_success_backlog()
+
+        with self.registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            transactions = env['orange.money.transaction'].browse(self.transaction_ids)
+            events = env['orange.money.webhook.event'].search([('payload', 'like', self.tag)])
+            self.assertEqual(set(events.mapped('state')), {'done'})
+            for transaction in transactions:
+                self.assertEqual(transaction.status, 'SUCCESS')
+                self.assertEqual(transaction.success_stage, 'done')
+                payments = env['account.payment'].search([
+                    ('ref', '=', f"Paiement Orange Money - {transaction.reference}"),
+                ])
+                self.assertEqual(len(payments), 1, f"{transaction.transaction_id} : un seul paiement attendu")
+                self.assertEqual(transaction.payment_id, payments)
+                self.assertEqual(env['orange.money.status.event'].search_count([
+                    ('transaction_id', '=', transaction.id),
+                    ('to_status', '=', 'SUCCESS'),
+                ]), 1, f"{transaction.transaction_id} : une seule transition SUCCESS attendue")
+
+
+@tagged('post_install', '-at_install')
+class TestOrangeMoneyRefusedTransition(TransactionCase):
+    """Un SUCCESS refusé (statut final déjà atteint) doit rester visible et rejouable."""
+
+    def setUp(self):
+        super().setUp()
+        self.transaction = self.env['orange.money.transaction'].with_context(mail_create_nolog=True).create({
+            'transaction_id': 'TEST-REFUSED-1',
+            'reference': 'REF-REFUSED-1',
+            'amount': 1000.0,
+            'status': 'INITIATED',
+        })
+        self.transaction._set_status('CANCELLED')
+
+    def test_refused_success_webhook_is_an_error(self):
+        data = {
+            'transactionId': 'OM-TEST-REFUSED-1',
+            'status': 'SUCCESS',
+            'amount': {'value': 1000.0, 'unit': 'XOF'},
+            'metadata': {'transaction_id': self.transaction.transaction_id},
+        }
+        event = self.env['orange.money.webhook.event']._enqueue(json.dumps(data), data)
+        event._process()
+
+        self.assertEqual(self.transaction.status, 'CANCELLED')
+        self.assertFalse(self.transaction.payment_id)
+        self.assertEqual(event.state, 'error')
+        self.assertIn('Transition refusée', event.error_message)
+        self.assertFalse(self.env['orange.money.status.event'].search_count([
+            ('transaction_id', '=', self.transaction.id),
+            ('to_status', '=', 'SUCCESS'),
+        ]))
+
+    def test_refused_transition_returns_false(self):
+        self.assertFalse(self.transaction._set_status('SUCCESS'))
+        self.assertFalse(self.transaction.write({'status': 'PENDING'}))
+        self.assertEqual(self.transaction.status, 'CANCELLED')